@@ -10,6 +10,9 @@ cd modelo_llama/streamlit-base
 
 rm -Rf __pycache__
 
+echo "Excluindo históricos de sessões arquivados..."
+rm -Rf sessoes_arquivadas
+
 cd ~/
 
 echo "Finalizado com sucesso..."
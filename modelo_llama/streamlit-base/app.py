@@ -1,7 +1,7 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import uuid
 import time
-import hmac
 import base64
 from datetime import datetime
 import re
@@ -11,7 +11,23 @@ from functions import (
     generate_chat_prompt,
     invoke_local_model,
     get_model_context_size,
-    search_knowledge_base
+    get_available_models,
+    get_model_stats,
+    get_rate_limit_status,
+    track_session,
+    search_knowledge_base,
+    reload_knowledge_base,
+    rebuild_knowledge_base,
+    get_knowledge_base_status
+)
+from auth_middleware import check_password_with_cookie, logout as auth_logout
+from chat_rendering import (
+    MESSAGES_PAGE_SIZE,
+    CHATS_PAGE_SIZE,
+    image_thumbnail,
+    message_window_start,
+    render_transcript_pages,
+    visible_chat_indices
 )
 
 def add_javascript():
@@ -46,12 +62,18 @@ st.set_page_config(
 )
 
 logo_path = "logo.png"
+logo_avatar = image_thumbnail(logo_path)
 
 def query_local_model(message, session_id="", model_params=None, context="", conversation_history=None):
     """Envia uma mensagem para o modelo local."""
     try:
         messages_for_model = generate_chat_prompt(message, conversation_history=conversation_history, context=context)
-        result = invoke_local_model(messages_for_model, model_params)
+        result = invoke_local_model(
+            messages_for_model,
+            model_params,
+            model_name=st.session_state.get('selected_model'),
+            user=st.session_state.get('auth_username')
+        )
 
         if not session_id:
             session_id = str(uuid.uuid4())
@@ -67,52 +89,21 @@ def query_local_model(message, session_id="", model_params=None, context="", con
             "sessionId": session_id or str(uuid.uuid4())
         }
 
-def check_password():
-    """Retorna `True` se o usuário tiver a senha correta."""
-    def password_entered():
-        if hmac.compare_digest(st.session_state.get("username", "").strip(), "admin") and \
-           hmac.compare_digest(st.session_state.get("password", "").strip(), "admin123"):
-            st.session_state["password_correct"] = True
-            if "password" in st.session_state: del st.session_state["password"]
-            if "username" in st.session_state: del st.session_state["username"]
-        else:
-            st.session_state["password_correct"] = False
-            st.session_state["login_attempt"] = True
-
-    if st.session_state.get("password_correct", False):
-        return True
-
-    st.markdown("""
-        <style>
-            .login-form { max-width: 400px; margin: 50px auto; padding: 2rem; border-radius: 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
-            .login-title { text-align: center; }
-        </style>
-    """, unsafe_allow_html=True)
-
-    with st.container():
-        st.markdown('<div class="login-form">', unsafe_allow_html=True)
-        st.markdown('<h1 class="login-title">Login</h1>', unsafe_allow_html=True)
-        st.text_input("Usuário", key="username")
-        st.text_input("Senha", type="password", key="password")
-        st.button("Entrar", on_click=password_entered, use_container_width=True)
-
-        if st.session_state.get("login_attempt", False) and not st.session_state.get("password_correct", False):
-            st.error("Usuário ou senha incorretos")
-
-        st.markdown('</div>', unsafe_allow_html=True)
-    return False
-
 def logout():
-    """Faz logout limpando o estado da sessão de forma segura."""
-    keys_to_delete = [
-        "password_correct", "login_attempt", "username",
-        "password", "auth_cookie"
-    ]
-    for key in keys_to_delete:
-        if key in st.session_state:
-            del st.session_state[key]
+    """Faz logout limpando o estado da sessão e o cookie de autenticação."""
+    auth_logout()
     st.rerun()
 
+def rerun_chat_area():
+    """
+    Reexecuta apenas o fragmento da área de chat quando possível.
+    Fora de um fragmento (ex.: ações da barra lateral) faz um rerun completo.
+    """
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
 # CORREÇÃO: A função agora aceita um argumento para a busca.
 def get_rag_context(user_query: str):
     """
@@ -133,7 +124,7 @@ def handle_message(user_message_content):
 
     st.session_state.messages.append({"role": "user", "content": user_message_raw, "time": datetime.now().strftime("%H:%M")})
 
-    with st.chat_message("assistant", avatar=logo_path):
+    with st.chat_message("assistant", avatar=logo_avatar):
         typing_placeholder = st.empty()
         typing_placeholder.markdown("... 🤔")
 
@@ -150,12 +141,23 @@ def handle_message(user_message_content):
 
     typing_placeholder.empty()
 
+    # Limite de uso atingido: a pergunta não foi respondida, então volta a não fazer parte do histórico.
+    if result.get("rate_limited"):
+        st.session_state.messages.pop()
+        st.warning(result.get("answer", "Limite de uso atingido."))
+        return
+
     assistant_message = result.get('answer', 'Não foi possível obter uma resposta.')
     st.session_state.session_id = result.get("sessionId", st.session_state.session_id)
 
     st.session_state.last_prompt_tokens = result.get("prompt_tokens", 0)
     st.session_state.last_completion_tokens = result.get("completion_tokens", 0)
     st.session_state.last_total_tokens = result.get("total_tokens", 0)
+    st.session_state.last_model = result.get("model", "")
+    st.session_state.last_latency = result.get("latency", 0.0)
+    st.session_state.last_tokens_per_second = result.get("tokens_per_second", 0.0)
+    if st.session_state.last_model:
+        st.session_state.model_context_size = get_model_context_size(st.session_state.last_model)
 
     st.session_state.messages.append({"role": "assistant", "content": assistant_message, "time": datetime.now().strftime("%H:%M")})
 
@@ -169,7 +171,12 @@ def handle_message(user_message_content):
     if st.session_state.current_chat_index != -1:
         st.session_state.chat_history[st.session_state.current_chat_index]["messages"] = st.session_state.messages
 
-    st.rerun()
+    # A primeira mensagem altera o título da conversa (cabeçalho e barra lateral), então
+    # precisa de um rerun completo; as demais só redesenham a área de chat.
+    if is_first_message:
+        st.rerun()
+    else:
+        rerun_chat_area()
 
 def extract_title_from_response(response_text):
     """Extrai um título resumido da primeira resposta."""
@@ -198,6 +205,15 @@ def regenerate_message(index):
             conversation_history=history_for_regeneration
         )
 
+    if result.get("rate_limited"):
+        # Sem resposta anterior (ex.: mensagem editada), a pergunta pendente sai do histórico.
+        has_answer = index + 1 < len(st.session_state.messages) and st.session_state.messages[index + 1]["role"] == "assistant"
+        if not has_answer:
+            st.session_state.messages.pop(index)
+        # O aviso é exibido no próximo rerun, que redesenha a área de chat sem a mensagem descartada.
+        st.session_state.rate_limit_warning = result.get("answer", "Limite de uso atingido.")
+        rerun_chat_area()
+
     new_response = result.get('answer', 'Não foi possível regenerar a resposta.')
     timestamp = datetime.now().strftime("%H:%M")
 
@@ -206,7 +222,7 @@ def regenerate_message(index):
     else:
         st.session_state.messages.append({"role": "assistant", "content": new_response, "time": timestamp})
 
-    st.rerun()
+    rerun_chat_area()
 
 def edit_message(index, new_content):
     """Edita uma mensagem e regenera a resposta se for do usuário."""
@@ -218,7 +234,7 @@ def edit_message(index, new_content):
             st.session_state.messages.pop(index + 1)
         regenerate_message(index)
     else:
-        st.rerun()
+        rerun_chat_area()
 
 def create_new_chat():
     """Cria uma nova conversa, salvando a anterior se necessário."""
@@ -235,6 +251,7 @@ def create_new_chat():
     st.session_state.messages = []
     st.session_state.session_id = ""
     st.session_state.chat_title = new_chat_title
+    st.session_state.message_window = MESSAGES_PAGE_SIZE
     st.rerun()
 
 def load_chat(index):
@@ -247,6 +264,7 @@ def load_chat(index):
     st.session_state.messages = chat["messages"].copy()
     st.session_state.session_id = chat["id"]
     st.session_state.chat_title = chat["title"]
+    st.session_state.message_window = MESSAGES_PAGE_SIZE
     st.rerun()
 
 def delete_chat(index):
@@ -266,7 +284,7 @@ def delete_chat(index):
             st.rerun()
 
 
-if not check_password():
+if not check_password_with_cookie():
     st.stop()
 
 # Bloco de inicialização do st.session_state
@@ -275,12 +293,25 @@ defaults = {
     'chat_title': "Nova Conversa", 'editing_message': None, 'edit_content': '',
     'use_rag': False, 'rag_source': 'Texto Direto', 'file_type': 'PDF',
     'uploaded_file': None, 'direct_text': '', 'last_prompt_tokens': 0,
-    'last_completion_tokens': 0, 'last_total_tokens': 0
+    'last_completion_tokens': 0, 'last_total_tokens': 0,
+    'selected_model': 'auto', 'last_model': '', 'last_latency': 0.0, 'last_tokens_per_second': 0.0,
+    'message_window': MESSAGES_PAGE_SIZE, 'sidebar_chat_limit': CHATS_PAGE_SIZE
 }
 for key, value in defaults.items():
     if key not in st.session_state:
         st.session_state[key] = value
 
+# Contabilidade de memória: registra o tamanho do histórico desta sessão e, se ele tiver
+# sido arquivado em disco por inatividade, o restaura antes da renderização.
+if 'resource_session_key' not in st.session_state:
+    st.session_state.resource_session_key = str(uuid.uuid4())
+track_session(
+    st.session_state.resource_session_key,
+    st.session_state.chat_history,
+    st.session_state.messages,
+    username=st.session_state.get('auth_username')
+)
+
 if 'model_context_size' not in st.session_state:
     st.session_state.model_context_size = get_model_context_size()
 
@@ -289,14 +320,15 @@ if not st.session_state.chat_history:
 
 # --- Sidebar ---
 with st.sidebar:
-    st.image(logo_path, width=50)
+    st.image(logo_avatar, width=50)
     st.title("Modelo de IA")
     if st.button("🔄 Nova Conversa", use_container_width=True):
         create_new_chat()
     st.divider()
 
     st.markdown("### Minhas Conversas")
-    for i in reversed(range(len(st.session_state.chat_history))):
+    total_chats = len(st.session_state.chat_history)
+    for i in visible_chat_indices(total_chats, st.session_state.sidebar_chat_limit):
         chat = st.session_state.chat_history[i]
         col1, col2 = st.columns([5, 1])
         with col1:
@@ -306,6 +338,12 @@ with st.sidebar:
             if st.button("🗑️", key=f"delete_{i}", help="Excluir conversa"):
                 delete_chat(i)
 
+    hidden_chats = total_chats - st.session_state.sidebar_chat_limit
+    if hidden_chats > 0:
+        if st.button(f"Mostrar mais ({hidden_chats} restantes)", use_container_width=True):
+            st.session_state.sidebar_chat_limit += CHATS_PAGE_SIZE
+            st.rerun()
+
     st.divider()
     # CORREÇÃO: Lógica do RAG na sidebar simplificada para apenas uma checkbox.
     st.session_state.use_rag = st.checkbox(
@@ -314,8 +352,43 @@ with st.sidebar:
         help="Permite que o modelo consulte os documentos pré-processados para obter respostas mais precisas."
     )
 
+    with st.expander("🛠️ Administração da Base"):
+        kb_status = get_knowledge_base_status()
+        st.markdown(f"**Versão ativa:** `{kb_status['version'] or 'nenhuma'}`")
+        st.markdown(f"**Reconstrução:** {kb_status['rebuild_status']}")
+        if kb_status["last_error"]:
+            st.error(kb_status["last_error"])
+
+        col_kb1, col_kb2 = st.columns(2)
+        with col_kb1:
+            if st.button("Reconstruir", use_container_width=True, help="Recria o índice a partir da pasta 'base_conhecimento' em segundo plano"):
+                if rebuild_knowledge_base():
+                    st.toast("Reconstrução iniciada. A nova versão será carregada automaticamente.")
+                else:
+                    st.toast("Já existe uma reconstrução em andamento.")
+        with col_kb2:
+            if st.button("Recarregar", use_container_width=True, help="Recarrega a versão ativa do índice sem reiniciar a aplicação"):
+                if reload_knowledge_base():
+                    st.toast("Base de conhecimento recarregada.")
+                elif get_knowledge_base_status()["last_error"]:
+                    st.error(f"Falha ao carregar o índice: {get_knowledge_base_status()['last_error']}")
+                else:
+                    st.toast("Nenhuma versão do índice disponível para carregar.")
+
+    model_options = ["auto"] + get_available_models()
+    st.session_state.selected_model = st.selectbox(
+        "🧠 Modelo",
+        options=model_options,
+        index=model_options.index(st.session_state.selected_model) if st.session_state.selected_model in model_options else 0,
+        format_func=lambda name: "Automático" if name == "auto" else name,
+        help="No modo automático, perguntas simples vão para modelos menores e troubleshooting para o modelo maior."
+    )
+
     st.divider()
     with st.expander("📊 Métricas da Última Interação"):
+        if st.session_state.last_model:
+            st.markdown(f"**Modelo:** `{st.session_state.last_model}`")
+            st.markdown(f"**Latência:** `{st.session_state.last_latency:.1f}` s · `{st.session_state.last_tokens_per_second:.1f}` tokens/s")
         st.markdown(f"**Entrada (Prompt):** `{st.session_state.last_prompt_tokens}` tokens")
         st.markdown(f"**Saída (Resposta):** `{st.session_state.last_completion_tokens}` tokens")
         st.markdown(f"**Total:** `{st.session_state.last_total_tokens}` tokens")
@@ -325,6 +398,23 @@ with st.sidebar:
             percentual_uso = (st.session_state.last_total_tokens / context_size) * 100
             st.progress(percentual_uso / 100, text=f"Uso do Contexto: {percentual_uso:.1f}% de {context_size}")
 
+    if st.session_state.get('auth_username'):
+        limit_status = get_rate_limit_status(st.session_state.auth_username)
+        available = max(0, int(limit_status["available_tokens"]))
+        st.caption(f"Cota: {available} de {limit_status['tokens_per_minute']} tokens/min disponíveis")
+
+    with st.expander("⚡ Desempenho por Modelo"):
+        model_stats = get_model_stats()
+        if not model_stats:
+            st.caption("Nenhuma requisição registrada ainda.")
+        for name, stats in model_stats.items():
+            status = "carregado" if stats["resident"] else "descarregado"
+            st.markdown(
+                f"**{name}** ({status})  \n"
+                f"`{stats['requests']}` requisições · `{stats['avg_latency']:.1f}` s em média · "
+                f"`{stats['tokens_per_second']:.1f}` tokens/s"
+            )
+
     st.divider()
     if st.button("Logout", use_container_width=True):
         logout()
@@ -332,34 +422,68 @@ with st.sidebar:
 # --- Interface Principal do Chat ---
 st.header(st.session_state.chat_title)
 
-chat_container = st.container(height=500, border=True)
-with chat_container:
-    for idx, message in enumerate(st.session_state.messages):
-        avatar = logo_path if message["role"] == "assistant" else "user"
-        with st.chat_message(message["role"], avatar=avatar):
-            if st.session_state.editing_message == idx:
-                new_content = st.text_area("Editar:", value=message["content"], key=f"edit_content_{idx}")
-                col1, col2 = st.columns(2)
-                if col1.button("Salvar", key=f"save_{idx}"):
-                    edit_message(idx, new_content)
-                if col2.button("Cancelar", key=f"cancel_{idx}"):
-                    st.session_state.editing_message = None
-                    st.rerun()
-            else:
-                st.markdown(message["content"])
-                if message["role"] == "user":
-                    col_b1, col_b2, col_b_spacer = st.columns([1, 1, 5])
-                    with col_b1:
-                        if st.button("✏️ Editar", key=f"edit_{idx}", help="Editar sua mensagem"):
-                            st.session_state.editing_message = idx
-                            st.rerun()
-                    with col_b2:
-                        if st.button("🔄 Regenerar", key=f"regen_{idx}", help="Gerar nova resposta"):
-                            regenerate_message(idx)
-
-# --- Entrada de Mensagem ---
-user_input = st.chat_input("Digite sua mensagem aqui...")
-if user_input:
-    handle_message(user_input)
+@st.fragment
+def render_chat_area():
+    """
+    Renderiza as mensagens e a entrada do chat em um fragmento, para que enviar, editar ou
+    regenerar uma mensagem não redesenhe a barra lateral.
+    Apenas a página mais recente é interativa; páginas anteriores carregadas sob demanda
+    são exibidas como blocos somente leitura.
+    """
+    # Reruns do fragmento não passam pelo topo do script, então a atividade é registrada aqui também.
+    track_session(
+        st.session_state.resource_session_key,
+        st.session_state.chat_history,
+        st.session_state.messages,
+        username=st.session_state.get('auth_username')
+    )
+
+    messages = st.session_state.messages
+    total_messages = len(messages)
+    window_start = message_window_start(total_messages, st.session_state.message_window)
+    live_start = message_window_start(total_messages, MESSAGES_PAGE_SIZE)
+
+    chat_container = st.container(height=500, border=True)
+    with chat_container:
+        if window_start > 0:
+            if st.button(f"⬆️ Carregar mensagens anteriores ({window_start} ocultas)", key="load_older_messages"):
+                st.session_state.message_window += MESSAGES_PAGE_SIZE
+                rerun_chat_area()
+
+        render_transcript_pages(messages, window_start, live_start)
+
+        for idx in range(live_start, total_messages):
+            message = messages[idx]
+            avatar = logo_avatar if message["role"] == "assistant" else "user"
+            with st.chat_message(message["role"], avatar=avatar):
+                if st.session_state.editing_message == idx:
+                    new_content = st.text_area("Editar:", value=message["content"], key=f"edit_content_{idx}")
+                    col1, col2 = st.columns(2)
+                    if col1.button("Salvar", key=f"save_{idx}"):
+                        edit_message(idx, new_content)
+                    if col2.button("Cancelar", key=f"cancel_{idx}"):
+                        st.session_state.editing_message = None
+                        rerun_chat_area()
+                else:
+                    st.markdown(message["content"])
+                    if message["role"] == "user":
+                        col_b1, col_b2, col_b_spacer = st.columns([1, 1, 5])
+                        with col_b1:
+                            if st.button("✏️ Editar", key=f"edit_{idx}", help="Editar sua mensagem"):
+                                st.session_state.editing_message = idx
+                                rerun_chat_area()
+                        with col_b2:
+                            if st.button("🔄 Regenerar", key=f"regen_{idx}", help="Gerar nova resposta"):
+                                regenerate_message(idx)
+
+    if 'rate_limit_warning' in st.session_state:
+        st.warning(st.session_state.pop('rate_limit_warning'))
+
+    # --- Entrada de Mensagem ---
+    user_input = st.chat_input("Digite sua mensagem aqui...")
+    if user_input:
+        handle_message(user_input)
+
+render_chat_area()
 
 add_javascript()
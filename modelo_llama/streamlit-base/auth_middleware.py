@@ -3,17 +3,67 @@ import hmac
 import hashlib
 import base64
 import json
+import os
+import secrets
 from datetime import datetime, timedelta
 
+# Configuração (variáveis de ambiente)
+AUTH_SECRET_KEY = os.environ.get("AUTH_SECRET_KEY", "")
+AUTH_USERNAME = os.environ.get("AUTH_USERNAME", "admin")
+AUTH_PASSWORD = os.environ.get("AUTH_PASSWORD", "admin123")
+AUTH_EXPIRY_DAYS = int(os.environ.get("AUTH_EXPIRY_DAYS", "7"))
+# Contas adicionais no formato "usuario1:senha1,usuario2:senha2". Cada conta tem sua própria cota de uso.
+AUTH_USERS = os.environ.get("AUTH_USERS", "")
+AUTH_SECRET_FILE = ".auth_secret"
+
+
+def load_accounts(extra_users=AUTH_USERS):
+    """Retorna as contas válidas (usuário -> senha): a conta principal mais as de AUTH_USERS."""
+    accounts = {AUTH_USERNAME: AUTH_PASSWORD}
+    for item in extra_users.split(","):
+        username, separator, password = item.strip().partition(":")
+        if not separator or not username.strip() or not password:
+            if item.strip():
+                print(f"AVISO: Conta inválida em AUTH_USERS ignorada: '{username.strip()}'.")
+            continue
+        accounts[username.strip()] = password
+    return accounts
+
+
+AUTH_ACCOUNTS = load_accounts()
+
+
+def load_or_create_secret_key(secret_path=AUTH_SECRET_FILE):
+    """
+    Lê a chave de assinatura gerada localmente, criando-a na primeira execução.
+    O arquivo é criado só com permissão do dono e não é versionado (.gitignore).
+    """
+    try:
+        with open(secret_path, "r", encoding="utf-8") as f:
+            secret_key = f.read().strip()
+        if secret_key:
+            return secret_key
+    except FileNotFoundError:
+        pass
+
+    secret_key = secrets.token_urlsafe(32)
+    fd = os.open(secret_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(secret_key)
+    print(f"AVISO: AUTH_SECRET_KEY não definida. Chave aleatória gerada e salva em '{secret_path}'.")
+    return secret_key
+
 class AuthManager:
     """
     Gerenciador de autenticação que utiliza cookies para manter a sessão ativa
     """
     
-    def __init__(self, cookie_name="generic_chat_auth", expiry_days=7):
+    def __init__(self, cookie_name="generic_chat_auth", expiry_days=AUTH_EXPIRY_DAYS, secret_key=None):
         self.cookie_name = cookie_name
         self.expiry_days = expiry_days
-        self.secret_key = "GENERIC_CHAT_SECRET_KEY"
+        self.secret_key = secret_key or AUTH_SECRET_KEY
+        if not self.secret_key:
+            self.secret_key = load_or_create_secret_key()
     
     def _create_signature(self, payload):
         """Cria uma assinatura para o payload usando HMAC"""
@@ -66,6 +116,25 @@ class AuthManager:
         except Exception:
             return False
     
+    def encode_token(self, cookie_value):
+        """Serializa o cookie de autenticação em um token texto: payload em base64 + assinatura"""
+        payload_b64 = base64.urlsafe_b64encode(json.dumps(cookie_value["payload"]).encode()).decode()
+        signature = cookie_value["signature"].replace("+", "-").replace("/", "_")
+        return f"{payload_b64}.{signature}"
+    
+    def decode_token(self, token):
+        """Converte um token texto de volta no formato de cookie (ou None se estiver malformado)"""
+        if not token or "." not in token:
+            return None
+        
+        try:
+            payload_b64, signature = token.split(".", 1)
+            payload = json.loads(base64.urlsafe_b64decode(payload_b64.encode()).decode())
+            signature = signature.replace("-", "+").replace("_", "/")
+            return {"payload": payload, "signature": signature}
+        except Exception:
+            return None
+    
     def get_username_from_cookie(self, cookie_value):
         """Obtém o username do cookie"""
         if not cookie_value:
@@ -77,19 +146,34 @@ class AuthManager:
         except Exception:
             return None
 
+auth_manager = AuthManager()
+
+def _set_browser_cookie(name, value, max_age):
+    """Grava (ou remove, com max_age=0) um cookie no navegador via JavaScript"""
+    st.components.v1.html(f"""
+        <script>
+            window.parent.document.cookie = "{name}={value}; path=/; max-age={max_age}; SameSite=Strict";
+        </script>
+    """, height=0)
+
 def check_password_with_cookie():
-    """Verificação de senha com suporte a cookies"""
-    auth_manager = AuthManager()
-    
+    """
+    Verificação de senha com suporte a cookies.
+    O token assinado fica em um cookie do navegador, então recarregar a página ou abrir
+    uma nova sessão websocket não exige um novo login enquanto o token for válido.
+    """
     def password_entered():
         """Verificação da senha digitada"""
-        if hmac.compare_digest(st.session_state["username"].strip(), "admin") and \
-           hmac.compare_digest(st.session_state["password"].strip(), "admin123"):
+        expected_password = AUTH_ACCOUNTS.get(st.session_state["username"].strip())
+        if expected_password is not None and \
+           hmac.compare_digest(st.session_state["password"].strip(), expected_password):
             
-            auth_cookie = auth_manager.create_auth_cookie(st.session_state["username"])
+            auth_cookie = auth_manager.create_auth_cookie(st.session_state["username"].strip())
             
             st.session_state["auth_cookie"] = auth_cookie
+            st.session_state["pending_auth_token"] = auth_manager.encode_token(auth_cookie)
             st.session_state["password_correct"] = True
+            st.session_state.pop("logged_out", None)
             
             del st.session_state["password"]
             del st.session_state["username"]
@@ -97,13 +181,28 @@ def check_password_with_cookie():
             st.session_state["password_correct"] = False
             st.session_state["login_attempt"] = True
     
+    # Nova sessão: tenta recuperar o token do cookie enviado pelo navegador
+    if "auth_cookie" not in st.session_state and not st.session_state.get("logged_out", False):
+        auth_cookie = auth_manager.decode_token(st.context.cookies.get(auth_manager.cookie_name))
+        if auth_cookie is not None:
+            st.session_state["auth_cookie"] = auth_cookie
+    
     if "auth_cookie" in st.session_state:
         if auth_manager.validate_auth_cookie(st.session_state["auth_cookie"]):
             st.session_state["password_correct"] = True
+            st.session_state["auth_username"] = auth_manager.get_username_from_cookie(st.session_state["auth_cookie"])
+            
+            pending_token = st.session_state.pop("pending_auth_token", None)
+            if pending_token:
+                _set_browser_cookie(auth_manager.cookie_name, pending_token, auth_manager.expiry_days * 24 * 3600)
             return True
         else:
             if "auth_cookie" in st.session_state:
                 del st.session_state["auth_cookie"]
+            st.session_state["password_correct"] = False
+    
+    if st.session_state.pop("clear_auth_cookie", False):
+        _set_browser_cookie(auth_manager.cookie_name, "", 0)
     
     if "password_correct" not in st.session_state:
         st.session_state["password_correct"] = False
@@ -155,8 +254,13 @@ def check_password_with_cookie():
 
 def logout():
     """Faz logout removendo o cookie de autenticação"""
-    if "auth_cookie" in st.session_state:
-        del st.session_state["auth_cookie"]
+    for key in ("auth_cookie", "auth_username", "pending_auth_token", "username", "password"):
+        if key in st.session_state:
+            del st.session_state[key]
     
     st.session_state["password_correct"] = False
-    st.session_state["login_attempt"] = False
\ No newline at end of file
+    st.session_state["login_attempt"] = False
+    # O cookie enviado na abertura da sessão continua visível em st.context.cookies,
+    # então ele é ignorado nesta sessão e removido do navegador na próxima execução.
+    st.session_state["logged_out"] = True
+    st.session_state["clear_auth_cookie"] = True
\ No newline at end of file
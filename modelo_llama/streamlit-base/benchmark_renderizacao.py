@@ -0,0 +1,136 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+import types
+
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def install_functions_stub():
+    """
+    Substitui o módulo `functions` por um stub, para executar o app.py real sem carregar
+    o modelo, os embeddings e o índice FAISS. A resposta do modelo é instantânea, então o
+    tempo medido é só o de execução do script e renderização.
+    """
+    stub = types.ModuleType("functions")
+
+    def invoke_local_model(messages, model_params=None, model_name=None, user=None):
+        return {
+            "answer": "Resposta de teste.",
+            "prompt_tokens": 10,
+            "completion_tokens": 5,
+            "total_tokens": 15,
+            "model": "stub",
+            "latency": 0.0,
+            "tokens_per_second": 0.0
+        }
+
+    stub.generate_chat_prompt = lambda message, conversation_history=None, context="": [
+        {"role": "user", "content": message}
+    ]
+    stub.invoke_local_model = invoke_local_model
+    stub.get_model_context_size = lambda model_name=None: 4096
+    stub.get_available_models = lambda: ["stub"]
+    stub.get_model_stats = lambda: {}
+    stub.get_rate_limit_status = lambda user: {
+        "available_tokens": 2000, "tokens_per_minute": 2000, "active_requests": 0, "max_concurrent": 4
+    }
+    stub.track_session = lambda session_key, chat_history, messages, username=None: False
+    stub.search_knowledge_base = lambda query, k=4: ""
+    stub.reload_knowledge_base = lambda: False
+    stub.rebuild_knowledge_base = lambda: False
+    stub.get_knowledge_base_status = lambda: {"version": None, "rebuild_status": "ocioso", "last_error": None}
+    sys.modules["functions"] = stub
+
+
+def build_history(total_messages, total_chats):
+    """Gera um histórico sintético com `total_messages` mensagens na conversa aberta."""
+    messages = []
+    for i in range(total_messages):
+        if i % 2 == 0:
+            content = f"Mensagem {i}: como configurar a VLAN {i} no switch?"
+            role = "user"
+        else:
+            content = f"Resposta {i}:\n\n1. Acesse o switch\n2. Execute `vlan {i}`\n3. Salve a configuração"
+            role = "assistant"
+        messages.append({"role": role, "content": content, "time": "10:00"})
+
+    chat_history = [{"id": f"chat-{i}", "title": f"Conversa {i}", "messages": []} for i in range(total_chats)]
+    chat_history[-1]["messages"] = messages
+    return messages, chat_history
+
+
+def new_app_test(total_messages, total_chats, app_path):
+    """Cria um AppTest do app.py já autenticado e com o histórico sintético carregado."""
+    from auth_middleware import auth_manager
+
+    messages, chat_history = build_history(total_messages, total_chats)
+    at = AppTest.from_file(app_path, default_timeout=120)
+    at.session_state["auth_cookie"] = auth_manager.create_auth_cookie("benchmark")
+    at.session_state["password_correct"] = True
+    at.session_state["messages"] = list(messages)
+    at.session_state["chat_history"] = chat_history
+    at.session_state["current_chat_index"] = total_chats - 1
+    at.session_state["chat_title"] = chat_history[-1]["title"]
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"Falha ao executar o app: {at.exception}")
+    return at
+
+
+def timed(action):
+    start_time = time.perf_counter()
+    action()
+    return (time.perf_counter() - start_time) * 1000
+
+
+def measure(total_messages, total_chats, repetitions, app_path):
+    """
+    Mede, em ms (mediana), um rerun completo do app e a interação com um botão da área de chat
+    (Editar e depois Cancelar na última mensagem do usuário), que passa pelo fragmento do chat.
+    """
+    at = new_app_test(total_messages, total_chats, app_path)
+    last_user_index = total_messages - 2 if total_messages % 2 == 0 else total_messages - 1
+
+    full_timings = []
+    chat_timings = []
+    for _ in range(repetitions):
+        full_timings.append(timed(at.run))
+        chat_timings.append(timed(lambda: at.button(key=f"edit_{last_user_index}").click().run()))
+        chat_timings.append(timed(lambda: at.button(key=f"cancel_{last_user_index}").click().run()))
+        if at.exception:
+            raise RuntimeError(f"Falha ao executar o app: {at.exception}")
+
+    return statistics.median(full_timings), statistics.median(chat_timings), len(at.button)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do tempo de rerun do app.py em função do tamanho do histórico.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10, 50, 100, 250, 500, 1000],
+                        help="Quantidades de mensagens na conversa aberta")
+    parser.add_argument("--conversas", type=int, default=None,
+                        help="Quantidade de conversas na barra lateral (padrão: igual ao número de mensagens)")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Repetições medidas por cenário")
+    parser.add_argument("--app", default=APP_PATH, help="Script Streamlit a medir (padrão: app.py)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AUTH_SECRET_KEY", "benchmark-secret")
+    app_dir = os.path.dirname(os.path.abspath(args.app))
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    install_functions_stub()
+
+    print(f"{'Mensagens':>10} | {'Rerun completo (ms)':>20} | {'Botão do chat (ms)':>19} | {'Botões':>7}")
+    print("-" * 66)
+    for total_messages in args.tamanhos:
+        total_chats = args.conversas if args.conversas is not None else total_messages
+        full_ms, chat_ms, buttons = measure(total_messages, max(1, total_chats), args.repeticoes, args.app)
+        print(f"{total_messages:>10} | {full_ms:>20.1f} | {chat_ms:>19.1f} | {buttons:>7}")
+
+
+if __name__ == "__main__":
+    main()
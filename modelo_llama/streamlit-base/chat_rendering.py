@@ -0,0 +1,65 @@
+import io
+from functools import lru_cache
+
+import streamlit as st
+from PIL import Image
+
+# Constantes
+MESSAGES_PAGE_SIZE = 20
+CHATS_PAGE_SIZE = 15
+AVATAR_SIZE_PX = 128
+
+
+@lru_cache(maxsize=4)
+def image_thumbnail(image_path, size=AVATAR_SIZE_PX):
+    """
+    Retorna os bytes PNG de uma miniatura da imagem, carregada uma única vez por processo.
+    Passar o caminho do logo original para st.chat_message faz o Streamlit decodificar e
+    redimensionar a imagem inteira a cada mensagem em cada rerun.
+    """
+    with Image.open(image_path) as image:
+        image.thumbnail((size, size))
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def message_window_start(total_messages, window_size):
+    """
+    Retorna o índice da primeira mensagem da janela visível.
+    A janela sempre começa em uma mensagem do usuário para não separar pergunta e resposta.
+    """
+    start = max(0, total_messages - window_size)
+    if start % 2 == 1:
+        start -= 1
+    return max(0, start)
+
+
+def page_ranges(start, end, page_size=MESSAGES_PAGE_SIZE):
+    """Divide o intervalo [start, end) em páginas de tamanho fixo, da mais antiga para a mais recente."""
+    return [(page_start, min(page_start + page_size, end)) for page_start in range(start, end, page_size)]
+
+
+def format_transcript_markdown(messages):
+    """Monta o markdown de uma página de mensagens antigas em um único bloco."""
+    blocks = []
+    for message in messages:
+        author = "🤖 Assistente" if message["role"] == "assistant" else "👤 Você"
+        time_label = f" · {message['time']}" if message.get("time") else ""
+        blocks.append(f"**{author}**{time_label}\n\n{message['content']}")
+    return "\n\n---\n\n".join(blocks)
+
+
+def render_transcript_pages(messages, start, end):
+    """
+    Renderiza as mensagens em [start, end) como páginas somente leitura.
+    Cada página vira um único elemento markdown em vez de um chat_message com botões por mensagem.
+    """
+    for page_start, page_end in page_ranges(start, end):
+        st.markdown(format_transcript_markdown(messages[page_start:page_end]))
+        st.divider()
+
+
+def visible_chat_indices(total_chats, limit):
+    """Retorna os índices das conversas exibidas na barra lateral, da mais recente para a mais antiga."""
+    return list(reversed(range(max(0, total_chats - limit), total_chats)))
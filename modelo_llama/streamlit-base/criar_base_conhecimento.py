@@ -1,25 +1,30 @@
 import os
+import shutil
 import time
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from index_manager import new_version_path, publish_version, prune_old_versions
 
 # Constantes
 KNOWLEDGE_BASE_DIR = "base_conhecimento"
-FAISS_INDEX_PATH = "faiss_index"
 
-def create_vector_store():
+def create_vector_store(embeddings=None):
     """
     Lê documentos de diferentes formatos de um diretório, os processa 
     e cria um índice FAISS para busca de similaridade.
+
+    O índice é salvo em um diretório de versão novo e só depois o ponteiro "current" é
+    atualizado, então uma reconstrução que falhe no meio nunca afeta a versão em uso.
+    Retorna o caminho da versão publicada, ou None em caso de falha.
     """
     print("Iniciando a criação da base de conhecimento...")
 
     if not os.path.exists(KNOWLEDGE_BASE_DIR):
         print(f"ERRO: A pasta '{KNOWLEDGE_BASE_DIR}' não foi encontrada.")
         print("Por favor, crie esta pasta e coloque seus documentos nela.")
-        return
+        return None
 
     all_documents = []
     start_time = time.time()
@@ -48,7 +53,7 @@ def create_vector_store():
 
     if not all_documents:
         print("Nenhum documento foi carregado. Verifique os arquivos na pasta 'base_conhecimento'. Encerrando.")
-        return
+        return None
         
     end_time = time.time()
     print(f"\nDocumentos carregados em {end_time - start_time:.2f} segundos. Total de {len(all_documents)} páginas/documentos.")
@@ -59,13 +64,14 @@ def create_vector_store():
     docs = text_splitter.split_documents(all_documents)
     print(f"Total de {len(docs)} chunks criados.")
 
-    # Define o modelo de embeddings
-    print("Carregando modelo de embeddings (pode baixar na primeira vez)...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={'device': 'cpu'}
-    )
-    print("Modelo de embeddings carregado.")
+    # Define o modelo de embeddings (reaproveita o da aplicação quando chamado por ela)
+    if embeddings is None:
+        print("Carregando modelo de embeddings (pode baixar na primeira vez)...")
+        embeddings = HuggingFaceEmbeddings(
+            model_name="sentence-transformers/all-MiniLM-L6-v2",
+            model_kwargs={'device': 'cpu'}
+        )
+        print("Modelo de embeddings carregado.")
 
     # Cria o índice FAISS
     print("Criando o índice FAISS... Isso pode levar alguns minutos dependendo do volume de documentos.")
@@ -74,9 +80,19 @@ def create_vector_store():
     end_time = time.time()
     print(f"Índice criado em {end_time - start_time:.2f} segundos.")
 
-    # Salva o índice localmente
-    db.save_local(FAISS_INDEX_PATH)
-    print(f"Base de conhecimento salva com sucesso em '{FAISS_INDEX_PATH}'!")
+    # Salva o índice em um diretório de versão novo e publica a versão de forma atômica
+    version_path = new_version_path()
+    try:
+        db.save_local(version_path)
+        publish_version(version_path)
+    except Exception as e:
+        print(f"ERRO ao salvar o índice em '{version_path}': {e}")
+        shutil.rmtree(version_path, ignore_errors=True)
+        return None
+    print(f"Base de conhecimento salva com sucesso em '{version_path}'!")
+
+    prune_old_versions()
+    return version_path
 
 if __name__ == "__main__":
     create_vector_store()
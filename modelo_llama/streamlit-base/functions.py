@@ -1,71 +1,124 @@
 import json
+import time
 import uuid
 from datetime import datetime
 import os
 import pandas as pd
 import PyPDF2
-from llama_cpp import Llama
 from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, DirectoryLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from index_manager import IndexManager
+from model_registry import AUTO_MODEL, ModelRegistry, load_registry_config
+from rate_limiter import RateLimiter, RateLimitExceeded
+from resource_monitor import ResourceMonitor, SessionTracker, check_upload_size, estimate_torch_module_mb
+from structured_output import (
+    DIAGNOSTIC_SCHEMA,
+    PartialJsonValidator,
+    clear_grammar_cache,
+    compile_grammar,
+    schema_instruction,
+    validate_against_schema
+)
 
-# Carrega o modelo uma vez durante a inicialização
-# ATENÇÃO: Certifique-se que o caminho para o seu modelo GGUF está correto.
-MODEL_PATH = "llama-2-7b-chat.gguf"
-
-# Um bloco try-except aqui pode ajudar a dar uma mensagem de erro mais clara se o modelo não for encontrado.
+# Registro de modelos: os modelos GGUF listados em 'modelos.json' são carregados sob demanda
+# e mantidos em um LRU limitado por orçamento de memória.
+# ATENÇÃO: Certifique-se que os caminhos dos modelos GGUF no registro estão corretos.
 try:
-    llm = Llama(
-        model_path=MODEL_PATH,
-        n_ctx=4096,
-        n_threads=os.cpu_count() or 6,
-        n_gpu_layers=0,
-        verbose=True
-    )
-except ValueError as e:
+    model_registry = ModelRegistry(load_registry_config())
+except (ValueError, KeyError, json.JSONDecodeError) as e:
     print("="*50)
-    print(f"ERRO CRÍTICO: Não foi possível carregar o modelo em '{MODEL_PATH}'.")
-    print("Verifique se o caminho está correto e o arquivo não está corrompido.")
+    print("ERRO CRÍTICO: Não foi possível ler o registro de modelos 'modelos.json'.")
     print(f"Detalhe do erro: {e}")
     print("="*50)
-    # Encerra o script se o modelo não puder ser carregado.
+    # Encerra o script se o registro for inválido.
     exit()
 
 
-FAISS_INDEX_PATH = "faiss_index"
-
 embeddings = HuggingFaceEmbeddings(
     model_name="sentence-transformers/all-MiniLM-L6-v2",
     model_kwargs={'device': 'cpu'}
 )
 
-# Carrega o índice FAISS se ele existir
-if os.path.exists(FAISS_INDEX_PATH):
-    print("Carregando base de conhecimento (FAISS)...")
-    db = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-    print("Base de conhecimento carregada com sucesso.")
-else:
-    db = None
-    print("AVISO: Base de conhecimento 'faiss_index' não encontrada. A função de busca estará desativada.")
+# Limitador por usuário (tokens gerados por minuto e requisições simultâneas) na frente do modelo
+rate_limiter = RateLimiter()
+
+# Carrega a versão ativa do índice FAISS e observa o ponteiro "current" para trocá-la
+# a quente quando a base for reconstruída, sem reiniciar a aplicação.
+index_manager = IndexManager(embeddings)
+index_manager.reload()
+if not index_manager.is_available():
+    print("AVISO: Base de conhecimento não encontrada. A função de busca estará desativada até que uma versão seja publicada.")
+index_manager.start_watcher()
+
+# Contabilidade de memória: RSS por componente, tamanho do histórico de cada sessão e limites.
+# A memória dos embeddings não muda depois da carga, então é calculada uma única vez.
+embeddings_memory_mb = estimate_torch_module_mb(getattr(embeddings, "client", None))
+session_tracker = SessionTracker()
+resource_monitor = ResourceMonitor(session_tracker)
+resource_monitor.register_component("Modelos LLM", lambda: sum(memory_mb for _, memory_mb in model_registry.resident_models()))
+resource_monitor.register_component("Embeddings", lambda: embeddings_memory_mb)
+resource_monitor.register_component("Índice FAISS", index_manager.memory_mb)
+resource_monitor.register_component("Sessões", session_tracker.total_mb)
+resource_monitor.register_shrink_action("modelos", lambda: model_registry.shrink(keep=1))
+resource_monitor.register_shrink_action("gramaticas", clear_grammar_cache)
+resource_monitor.register_shrink_action("sessoes", lambda: session_tracker.enforce_total_limit(max_mb=1))
+resource_monitor.start()
 
 def search_knowledge_base(query: str, k: int = 4) -> str:
     """
     Busca na base de conhecimento FAISS os chunks mais relevantes para a query.
     """
-    if db is None:
-        return "A base de conhecimento não está disponível."
-    
-    print(f"Buscando por: '{query}' na base de conhecimento...")
-    # Realiza a busca por similaridade
-    results = db.similarity_search(query, k=k)
+    with index_manager.acquire() as db:
+        if db is None:
+            return "A base de conhecimento não está disponível."
+
+        print(f"Buscando por: '{query}' na base de conhecimento...")
+        # Realiza a busca por similaridade
+        results = db.similarity_search(query, k=k)
     
     # Formata os resultados para incluir no prompt
     context = "\n\n---\n\n".join([doc.page_content for doc in results])
     return context
 
+def search_knowledge_base_batch(queries, k: int = 4):
+    """
+    Busca o contexto de várias queries de uma vez.
+    Os embeddings são calculados em um único lote, e todas as buscas usam a mesma versão do índice.
+    """
+    with index_manager.acquire() as db:
+        if db is None:
+            return ["A base de conhecimento não está disponível."] * len(queries)
+
+        vectors = embeddings.embed_documents(list(queries))
+        contexts = []
+        for vector in vectors:
+            results = db.similarity_search_by_vector(vector, k=k)
+            contexts.append("\n\n---\n\n".join([doc.page_content for doc in results]))
+    return contexts
+
+def reload_knowledge_base():
+    """Força a recarga da versão ativa do índice FAISS. Retorna True se houve troca."""
+    return index_manager.reload(force=True)
+
+def rebuild_knowledge_base():
+    """Reconstrói a base de conhecimento em segundo plano e publica a nova versão."""
+    return index_manager.rebuild_in_background()
+
+def get_knowledge_base_status():
+    """Retorna informações sobre a versão ativa do índice e a última reconstrução."""
+    return {
+        "version": index_manager.current_version,
+        "rebuild_status": index_manager.rebuild_status,
+        "last_error": index_manager.last_error
+    }
+
 def read_pdf_from_uploaded_file(uploaded_file):
     """Lê o conteúdo de um arquivo PDF carregado pelo Streamlit."""
+    upload_error = check_upload_size(uploaded_file)
+    if upload_error:
+        return f"Erro ao ler PDF: {upload_error}"
     try:
         import io
         from PyPDF2 import PdfReader
@@ -81,6 +134,9 @@ def read_pdf_from_uploaded_file(uploaded_file):
 
 def read_txt_from_uploaded_file(uploaded_file):
     """Lê o conteúdo de um arquivo TXT carregado pelo Streamlit."""
+    upload_error = check_upload_size(uploaded_file)
+    if upload_error:
+        return f"Erro ao ler TXT: {upload_error}"
     try:
         return uploaded_file.getvalue().decode("utf-8")
     except Exception as e:
@@ -88,6 +144,9 @@ def read_txt_from_uploaded_file(uploaded_file):
 
 def read_csv_from_uploaded_file(uploaded_file):
     """Lê o conteúdo de um arquivo CSV carregado pelo Streamlit."""
+    upload_error = check_upload_size(uploaded_file)
+    if upload_error:
+        return f"Erro ao ler CSV: {upload_error}"
     try:
         import pandas as pd
         import io
@@ -133,9 +192,17 @@ Comece a análise agora.
     
     return messages
 
-def invoke_local_model(messages, model_params=None):
+def resolve_model_name(messages, model_name=None):
+    """Retorna o modelo a ser usado: o escolhido manualmente ou o roteado automaticamente."""
+    if not model_name or model_name == AUTO_MODEL:
+        return model_registry.route(messages)
+    return model_name
+
+def invoke_local_model(messages, model_params=None, model_name=None, user=None):
     """
     Invoca o modelo Llama local e retorna a resposta junto com a contagem de tokens.
+    Sem `model_name` (ou com "auto"), o modelo é escolhido pelo roteador do registro.
+    Com `user`, a chamada passa pelo limitador de tokens por minuto e de simultaneidade.
     """
     if model_params is None:
         model_params = {
@@ -148,15 +215,22 @@ def invoke_local_model(messages, model_params=None):
     try:
         if not isinstance(messages, list) or not messages:
             raise ValueError("Mensagens inválidas ou vazias.")
-              
-        response = llm.create_chat_completion(
-            messages=messages,
-            temperature=model_params["temperature"],
-            max_tokens=model_params["max_tokens"],
-            top_p=model_params["top_p"],
-            top_k=model_params["top_k"],
-            stop=["\nUsuário:", "###", "</s>"],
-        )
+
+        with rate_limiter.acquire(user):
+            model_name = resolve_model_name(messages, model_name)
+            with model_registry.acquire(model_name) as model:
+                model_name = model.spec["name"]
+                with model.inference_lock:
+                    start_time = time.perf_counter()
+                    response = model.llm.create_chat_completion(
+                        messages=messages,
+                        temperature=model_params["temperature"],
+                        max_tokens=model_params["max_tokens"],
+                        top_p=model_params["top_p"],
+                        top_k=model_params["top_k"],
+                        stop=["\nUsuário:", "###", "</s>"],
+                    )
+                    latency = time.perf_counter() - start_time
         
         if not response or 'choices' not in response or not response['choices']:
             raise ValueError("Resposta inválida do modelo")
@@ -167,6 +241,8 @@ def invoke_local_model(messages, model_params=None):
         prompt_tokens = usage_data.get('prompt_tokens', 0)
         completion_tokens = usage_data.get('completion_tokens', 0)
         total_tokens = usage_data.get('total_tokens', 0)
+        model_registry.record(model_name, latency, completion_tokens)
+        rate_limiter.consume(user, completion_tokens)
 
         if not answer:
             answer = "Não consegui gerar uma resposta. Poderia reformular?"
@@ -176,9 +252,25 @@ def invoke_local_model(messages, model_params=None):
             "sessionId": str(uuid.uuid4()),
             "prompt_tokens": prompt_tokens,
             "completion_tokens": completion_tokens,
-            "total_tokens": total_tokens
+            "total_tokens": total_tokens,
+            "model": model_name,
+            "latency": latency,
+            "tokens_per_second": completion_tokens / latency if latency > 0 else 0.0
         }
         
+    except RateLimitExceeded as e:
+        print(f"Limite de uso atingido para '{user}': {str(e)}")
+        return {
+            "error": str(e),
+            "rate_limited": True,
+            "retry_after": e.retry_after,
+            "answer": f"⏳ {str(e)}",
+            "sessionId": str(uuid.uuid4()),
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0
+        }
+
     except Exception as e:
         print(f"ERRO DETALHADO na invocação do modelo: {str(e)}")
         # CORREÇÃO: Garante que o dicionário retornado em caso de erro tenha a mesma estrutura.
@@ -191,6 +283,188 @@ def invoke_local_model(messages, model_params=None):
             "total_tokens": 0
         }
 
-def get_model_context_size():
-    """Retorna o tamanho da janela de contexto (n_ctx) do modelo carregado."""
-    return llm.n_ctx()
+def count_prompt_tokens(llm, messages):
+    """
+    Conta os tokens do prompt como o llama.cpp o avalia: depois de aplicado o template de chat
+    do modelo (tokens especiais e BOS incluídos). O streaming de create_chat_completion não
+    informa "usage", então a contagem é feita aqui.
+    """
+    from llama_cpp import llama_chat_format
+
+    try:
+        # Mesma escolha de template feita pelo Llama: o do GGUF, se houver, senão o formato llama-2.
+        template = llm.metadata.get("tokenizer.chat_template")
+        if template:
+            formatter = llama_chat_format.Jinja2ChatFormatter(
+                template=template,
+                eos_token=llm._model.token_get_text(llm.token_eos()),
+                bos_token=llm._model.token_get_text(llm.token_bos())
+            )
+        else:
+            formatter = llama_chat_format.format_llama2
+        formatted = formatter(messages=messages)
+        return len(llm.tokenize(
+            formatted.prompt.encode("utf-8"), add_bos=not formatted.added_special, special=True
+        ))
+    except Exception as e:
+        print(f"Aviso: não foi possível aplicar o template de chat para contar tokens: {e}")
+        return sum(len(llm.tokenize(message["content"].encode("utf-8"), add_bos=False)) for message in messages)
+
+
+def invoke_local_model_structured(messages, schema=DIAGNOSTIC_SCHEMA, model_params=None, on_partial=None, model_name=None,
+                                  user=None):
+    """
+    Invoca o modelo Llama local com a decodificação restrita a um JSON schema (gramática GBNF).
+
+    A resposta é gerada em streaming e validada incrementalmente; a geração é encerrada assim
+    que o objeto JSON de nível superior é fechado. `on_partial`, se informado, recebe o objeto
+    parcial a cada trecho gerado. Retorna o mesmo dicionário de `invoke_local_model` com o
+    objeto já convertido em "data".
+    """
+    if model_params is None:
+        model_params = {
+            "temperature": 0.2,
+            "top_p": 0.8,
+            "top_k": 20,
+            "max_tokens": 800
+        }
+
+    try:
+        if not isinstance(messages, list) or not messages:
+            raise ValueError("Mensagens inválidas ou vazias.")
+
+        # Reforça o formato esperado na última mensagem do usuário, sem alterar a lista original.
+        constrained_messages = [dict(message) for message in messages]
+        constrained_messages[-1]["content"] += schema_instruction(schema)
+
+        with rate_limiter.acquire(user):
+            model_name = resolve_model_name(constrained_messages, model_name)
+            with model_registry.acquire(model_name) as model:
+                model_name = model.spec["name"]
+                with model.inference_lock:
+                    llm = model.llm
+                    prompt_tokens = count_prompt_tokens(llm, constrained_messages)
+
+                    start_time = time.perf_counter()
+                    stream = llm.create_chat_completion(
+                        messages=constrained_messages,
+                        temperature=model_params["temperature"],
+                        max_tokens=model_params["max_tokens"],
+                        top_p=model_params["top_p"],
+                        top_k=model_params["top_k"],
+                        grammar=compile_grammar(schema),
+                        stream=True,
+                    )
+
+                    validator = PartialJsonValidator()
+                    try:
+                        for chunk in stream:
+                            delta = chunk["choices"][0].get("delta", {}).get("content")
+                            if not delta:
+                                continue
+                            finished = validator.feed(delta)
+                            if validator.error:
+                                raise ValueError(f"JSON inválido durante a geração: {validator.error}")
+                            if on_partial is not None:
+                                partial = validator.partial_object()
+                                if partial is not None:
+                                    on_partial(partial)
+                            if finished:
+                                break
+                    finally:
+                        # Fechar o gerador interrompe a decodificação no llama.cpp (parada antecipada).
+                        stream.close()
+                        # Os trechos do streaming não correspondem a tokens: conta sobre o texto gerado.
+                        completion_tokens = len(llm.tokenize(validator.text.encode("utf-8"), add_bos=False))
+                        rate_limiter.consume(user, completion_tokens)
+                    latency = time.perf_counter() - start_time
+
+        model_registry.record(model_name, latency, completion_tokens)
+
+        if not validator.complete:
+            raise ValueError("A geração terminou antes de o objeto JSON ser fechado.")
+
+        data = json.loads(validator.text)
+        validation_error = validate_against_schema(data, schema)
+        if validation_error:
+            raise ValueError(f"Resposta fora do esquema: {validation_error}")
+
+        return {
+            "answer": validator.text.strip(),
+            "data": data,
+            "sessionId": str(uuid.uuid4()),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "model": model_name,
+            "latency": latency,
+            "tokens_per_second": completion_tokens / latency if latency > 0 else 0.0
+        }
+
+    except RateLimitExceeded as e:
+        print(f"Limite de uso atingido para '{user}': {str(e)}")
+        return {
+            "error": str(e),
+            "rate_limited": True,
+            "retry_after": e.retry_after,
+            "answer": f"⏳ {str(e)}",
+            "data": None,
+            "sessionId": str(uuid.uuid4()),
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0
+        }
+
+    except Exception as e:
+        print(f"ERRO DETALHADO na invocação estruturada do modelo: {str(e)}")
+        return {
+            "error": str(e),
+            "answer": f"Ocorreu um erro ao processar sua solicitação: {str(e)}",
+            "data": None,
+            "sessionId": str(uuid.uuid4()),
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0
+        }
+
+def get_model_context_size(model_name=None):
+    """Retorna o tamanho da janela de contexto (n_ctx) do modelo (padrão do registro se não informado)."""
+    if not model_name or model_name == AUTO_MODEL:
+        model_name = None
+    return model_registry.context_size(model_name)
+
+def get_available_models():
+    """Retorna os nomes dos modelos do registro, do mais leve ao mais pesado."""
+    return model_registry.model_names()
+
+def get_rate_limit_status(user):
+    """Retorna o saldo de tokens e as requisições em andamento do usuário."""
+    return rate_limiter.get_status(user)
+
+def track_session(session_key, chat_history, messages, username=None):
+    """Registra a atividade da sessão e restaura o histórico se ele tiver sido arquivado em disco."""
+    return session_tracker.touch(session_key, chat_history, messages, username)
+
+def get_resource_report():
+    """Retorna o RSS atual por componente, as sessões acompanhadas e o histórico de amostras."""
+    rss_mb, components = resource_monitor.breakdown()
+    return {
+        "rss_mb": rss_mb,
+        "components": components,
+        "sessions": session_tracker.get_sessions(),
+        "samples": list(resource_monitor.samples),
+        "memory_soft_limit_mb": resource_monitor.memory_soft_limit_mb,
+        "last_shrink": resource_monitor.last_shrink
+    }
+
+def shrink_memory():
+    """Executa imediatamente as ações de redução de memória (modelos, caches e sessões)."""
+    resource_monitor.shrink()
+
+def archive_idle_sessions(idle_seconds):
+    """Arquiva em disco o histórico das sessões ociosas há mais de `idle_seconds`. Retorna os MB liberados."""
+    return session_tracker.evict_idle(idle_seconds)
+
+def get_model_stats():
+    """Retorna a latência média e os tokens/s de cada modelo já utilizado."""
+    return model_registry.get_stats()
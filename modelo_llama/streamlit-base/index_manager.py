@@ -0,0 +1,252 @@
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from resource_monitor import estimate_index_mb
+
+# Constantes
+FAISS_INDEX_PATH = "faiss_index"
+INDEX_VERSIONS_DIR = "faiss_index_versions"
+CURRENT_POINTER_FILE = "faiss_index_current"
+VERSIONS_TO_KEEP = 3
+
+
+def new_version_path():
+    """Retorna um caminho novo (ainda inexistente) para uma versão do índice."""
+    version_name = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return os.path.join(INDEX_VERSIONS_DIR, version_name)
+
+
+def read_current_version():
+    """
+    Lê o ponteiro "current" e retorna o caminho da versão ativa do índice.
+    Caso o ponteiro não exista, usa o diretório legado 'faiss_index' se ele existir.
+    """
+    try:
+        with open(CURRENT_POINTER_FILE, "r", encoding="utf-8") as f:
+            version_name = f.read().strip()
+        if version_name:
+            version_path = os.path.join(INDEX_VERSIONS_DIR, version_name)
+            if os.path.isdir(version_path):
+                return version_path
+    except FileNotFoundError:
+        pass
+
+    if os.path.isdir(FAISS_INDEX_PATH):
+        return FAISS_INDEX_PATH
+    return None
+
+
+def publish_version(version_path):
+    """
+    Aponta o ponteiro "current" para a versão informada de forma atômica.
+    O arquivo temporário é gravado por completo e depois substitui o ponteiro com os.replace,
+    assim um leitor nunca enxerga um ponteiro pela metade.
+    """
+    version_name = os.path.basename(os.path.normpath(version_path))
+    tmp_path = f"{CURRENT_POINTER_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version_name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, CURRENT_POINTER_FILE)
+
+
+def pointer_signature(version_path):
+    """Identifica a publicação atual: a versão apontada e o mtime do ponteiro (se existir)."""
+    try:
+        return version_path, os.path.getmtime(CURRENT_POINTER_FILE)
+    except OSError:
+        return version_path, None
+
+
+def prune_old_versions(keep=VERSIONS_TO_KEEP):
+    """Remove as versões mais antigas do índice, preservando sempre a versão ativa."""
+    if not os.path.isdir(INDEX_VERSIONS_DIR):
+        return
+
+    current = read_current_version()
+    versions = sorted(
+        name for name in os.listdir(INDEX_VERSIONS_DIR)
+        if os.path.isdir(os.path.join(INDEX_VERSIONS_DIR, name))
+    )
+    for name in versions[:-keep] if keep > 0 else versions:
+        path = os.path.join(INDEX_VERSIONS_DIR, name)
+        if current and os.path.samefile(path, current):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class _IndexVersion:
+    """Versão carregada do índice com contagem de referências das buscas em andamento."""
+
+    def __init__(self, path, db):
+        self.path = path
+        self.db = db
+        self.memory_mb = estimate_index_mb(db)
+        self.refcount = 0
+        self.retired = False
+
+
+class IndexManager:
+    """
+    Gerenciador do índice FAISS com troca a quente.
+
+    As buscas obtêm a versão ativa através de `acquire()`, que apenas incrementa um contador.
+    A carga de uma nova versão acontece fora do lock, em segundo plano, e a troca é só a
+    substituição de uma referência; a versão antiga é liberada quando a última busca termina.
+    """
+
+    def __init__(self, embeddings, poll_interval=5.0):
+        self.embeddings = embeddings
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._current = None
+        self._retired = []
+        self._watcher = None
+        self._stop_event = threading.Event()
+        self.last_error = None
+        self.rebuild_status = "ocioso"
+        # Versão publicada que falhou ao carregar; não é recarregada até o ponteiro mudar.
+        self._failed_version = None
+
+    def _load(self, version_path):
+        from langchain_community.vectorstores import FAISS
+        return FAISS.load_local(version_path, self.embeddings, allow_dangerous_deserialization=True)
+
+    @property
+    def current_version(self):
+        """Caminho da versão ativa do índice (ou None)."""
+        current = self._current
+        return current.path if current else None
+
+    def is_available(self):
+        return self._current is not None
+
+    def memory_mb(self):
+        """Memória estimada da versão ativa mais as versões antigas ainda em uso."""
+        with self._lock:
+            versions = ([self._current] if self._current is not None else []) + self._retired
+            return sum(version.memory_mb for version in versions)
+
+    def reload(self, force=False):
+        """
+        Carrega a versão apontada pelo ponteiro "current" se ela for diferente da ativa.
+        Uma versão que falhou ao carregar só é tentada de novo quando o ponteiro muda (ou com `force`).
+        Retorna True se houve troca de versão.
+        """
+        with self._reload_lock:
+            version_path = read_current_version()
+            if version_path is None:
+                return False
+            if not force and self._current is not None and self._current.path == version_path:
+                return False
+            signature = pointer_signature(version_path)
+            if not force and signature == self._failed_version:
+                return False
+
+            print(f"Carregando base de conhecimento (FAISS) de '{version_path}'...")
+            try:
+                db = self._load(version_path)
+            except Exception as e:
+                # Uma versão inválida nunca substitui a versão ativa.
+                self.last_error = str(e)
+                self._failed_version = signature
+                print(f"ERRO ao carregar o índice '{version_path}': {e}")
+                return False
+
+            new_version = _IndexVersion(version_path, db)
+            with self._lock:
+                old_version = self._current
+                self._current = new_version
+                if old_version is not None:
+                    old_version.retired = True
+                    self._retired.append(old_version)
+                self._release_retired()
+
+            self.last_error = None
+            self._failed_version = None
+            print(f"Base de conhecimento '{version_path}' carregada com sucesso.")
+            return True
+
+    def _release_retired(self):
+        """Descarta as versões antigas que não têm mais buscas em andamento. Chamar com o lock."""
+        still_in_use = []
+        for version in self._retired:
+            if version.refcount > 0:
+                still_in_use.append(version)
+            else:
+                version.db = None
+        self._retired = still_in_use
+
+    @contextmanager
+    def acquire(self):
+        """Obtém a versão ativa do índice durante uma busca (ou None se não houver índice)."""
+        with self._lock:
+            version = self._current
+            if version is not None:
+                version.refcount += 1
+        try:
+            yield version.db if version is not None else None
+        finally:
+            if version is not None:
+                with self._lock:
+                    version.refcount -= 1
+                    if version.retired:
+                        self._release_retired()
+
+    def start_watcher(self):
+        """Inicia a thread que observa o ponteiro "current" e recarrega o índice quando ele muda."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+
+        def watch():
+            while not self._stop_event.wait(self.poll_interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"ERRO no monitoramento do índice: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="faiss-index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop_event.set()
+
+    def rebuild_in_background(self):
+        """
+        Reconstrói a base de conhecimento em uma thread e publica a nova versão.
+        Retorna False se já houver uma reconstrução em andamento.
+        """
+        def rebuild():
+            from criar_base_conhecimento import KNOWLEDGE_BASE_DIR, create_vector_store
+            start_time = time.time()
+            try:
+                version_path = create_vector_store(embeddings=self.embeddings)
+                if version_path is None:
+                    self.last_error = (
+                        f"Nenhuma versão do índice foi criada. Verifique se a pasta '{KNOWLEDGE_BASE_DIR}' existe "
+                        "e contém documentos legíveis (detalhes no log)."
+                    )
+                    self.rebuild_status = "falhou"
+                    return
+                self.reload()
+                self.rebuild_status = f"concluído em {time.time() - start_time:.1f}s"
+            except Exception as e:
+                self.last_error = str(e)
+                self.rebuild_status = "falhou"
+                print(f"ERRO ao reconstruir a base de conhecimento: {e}")
+
+        # Verificar e marcar o status sob o mesmo lock impede que dois cliques simultâneos
+        # iniciem duas reconstruções.
+        with self._rebuild_lock:
+            if self.rebuild_status == "em andamento":
+                return False
+            self.rebuild_status = "em andamento"
+        threading.Thread(target=rebuild, name="faiss-index-rebuild", daemon=True).start()
+        return True
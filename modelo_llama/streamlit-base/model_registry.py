@@ -0,0 +1,265 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Constantes
+MODEL_REGISTRY_PATH = "modelos.json"
+DEFAULT_MODEL_PATH = "llama-2-7b-chat.gguf"
+DEFAULT_MEMORY_BUDGET_MB = 8192
+AUTO_MODEL = "auto"
+
+# Termos que indicam uma pergunta de troubleshooting, que sempre vai para um modelo "complex"
+COMPLEX_KEYWORDS = re.compile(
+    r"\b(erro|falha|problema|não funciona|nao funciona|lent[oa]|queda|cai|configur\w*|diagnos\w*|"
+    r"troubleshoot\w*|log|logs|vpn|firewall|ospf|bgp|vlan|acl|nat|ips|ids|ataque|invas\w*)\b",
+    re.IGNORECASE
+)
+
+
+def _default_config():
+    """Configuração usada quando não existe 'modelos.json': apenas o modelo 7B original."""
+    return {
+        "memory_budget_mb": DEFAULT_MEMORY_BUDGET_MB,
+        "default_model": "llama-2-7b-chat",
+        "simple_max_chars": 0,
+        "models": [
+            {
+                "name": "llama-2-7b-chat",
+                "path": DEFAULT_MODEL_PATH,
+                "quantization": "Q4_K_M",
+                "n_ctx": 4096,
+                "complexity": "complex"
+            }
+        ]
+    }
+
+
+def load_registry_config(config_path=MODEL_REGISTRY_PATH):
+    """Lê o arquivo de registro de modelos, ou retorna a configuração padrão se ele não existir."""
+    if not os.path.exists(config_path):
+        print(f"AVISO: Registro de modelos '{config_path}' não encontrado. Usando apenas '{DEFAULT_MODEL_PATH}'.")
+        return _default_config()
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    if not config.get("models"):
+        raise ValueError(f"O registro '{config_path}' não possui nenhum modelo em 'models'.")
+    names = [model["name"] for model in config["models"]]
+    if len(names) != len(set(names)):
+        raise ValueError(f"O registro '{config_path}' possui nomes de modelo repetidos.")
+    config.setdefault("default_model", names[-1])
+    config.setdefault("memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB)
+    config.setdefault("simple_max_chars", 200)
+    return config
+
+
+def classify_request(messages, simple_max_chars):
+    """
+    Classificador barato da pergunta: "simple" para saudações e definições curtas,
+    "complex" para troubleshooting, perguntas longas ou com contexto adicional.
+    """
+    question = messages[-1]["content"] if messages else ""
+    if len(question) > simple_max_chars:
+        return "complex"
+    if COMPLEX_KEYWORDS.search(question):
+        return "complex"
+    return "simple"
+
+
+class _ResidentModel:
+    """Modelo carregado na memória, com lock de inferência e contador de uso."""
+
+    def __init__(self, spec, llm, memory_mb):
+        self.spec = spec
+        self.llm = llm
+        self.memory_mb = memory_mb
+        self.in_use = 0
+        # Uma instância do llama.cpp não suporta chamadas concorrentes.
+        self.inference_lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Registro de modelos GGUF com carga sob demanda.
+
+    Os modelos ficam em um LRU limitado por um orçamento de memória: ao carregar um modelo
+    que não cabe, os modelos menos usados recentemente (e que não estão em uso) são descarregados.
+    Também mantém as métricas de latência e tokens/s de cada modelo.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.specs = OrderedDict((spec["name"], spec) for spec in config["models"])
+        self.default_model = config["default_model"]
+        self.memory_budget_mb = config["memory_budget_mb"]
+        self.simple_max_chars = config["simple_max_chars"]
+        self._resident = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.specs}
+        # Despejo + carga acontecem um modelo por vez: duas cargas simultâneas de modelos diferentes
+        # calculariam o despejo a partir do mesmo uso de memória e estourariam o orçamento juntas.
+        self._budget_lock = threading.Lock()
+        self._stats = {
+            name: {"requests": 0, "total_latency": 0.0, "completion_tokens": 0, "generation_time": 0.0}
+            for name in self.specs
+        }
+
+        if self.default_model not in self.specs:
+            raise ValueError(f"Modelo padrão '{self.default_model}' não está no registro.")
+        for spec in self.specs.values():
+            if not os.path.exists(spec["path"]):
+                print(f"AVISO: Arquivo do modelo '{spec['name']}' não encontrado em '{spec['path']}'.")
+
+    def model_names(self):
+        return list(self.specs)
+
+    def context_size(self, name=None):
+        """Retorna o n_ctx configurado do modelo, sem precisar carregá-lo."""
+        return self.specs[name or self.default_model].get("n_ctx", 4096)
+
+    def estimate_memory_mb(self, spec):
+        """Memória estimada do modelo: valor do registro ou tamanho do arquivo GGUF com uma margem."""
+        if spec.get("memory_mb"):
+            return spec["memory_mb"]
+        try:
+            return os.path.getsize(spec["path"]) / (1024 * 1024) * 1.2
+        except OSError:
+            return 0
+
+    def resident_models(self):
+        """Lista os modelos carregados, do menos para o mais recentemente usado."""
+        with self._lock:
+            return [(name, entry.memory_mb) for name, entry in self._resident.items()]
+
+    def route(self, messages):
+        """
+        Escolhe o modelo para a requisição: o primeiro modelo do registro (ordenado do mais leve
+        ao mais pesado) compatível com a complexidade da pergunta e o tamanho do prompt.
+        Modelos cujo arquivo GGUF não existe são ignorados.
+        """
+        complexity = classify_request(messages, self.simple_max_chars)
+        prompt_chars = sum(len(message.get("content", "")) for message in messages)
+
+        for name, spec in self.specs.items():
+            if not os.path.exists(spec["path"]):
+                continue
+            if spec.get("complexity", "complex") == "simple" and complexity != "simple":
+                continue
+            max_prompt_chars = spec.get("max_prompt_chars")
+            if max_prompt_chars and prompt_chars > max_prompt_chars:
+                continue
+            return name
+        return self.default_model
+
+    def _load(self, spec):
+        from llama_cpp import Llama
+        print(f"Carregando modelo '{spec['name']}' ({spec['path']})...")
+        return Llama(
+            model_path=spec["path"],
+            n_ctx=spec.get("n_ctx", 4096),
+            n_threads=spec.get("n_threads") or os.cpu_count() or 6,
+            n_gpu_layers=0,
+            verbose=spec.get("verbose", False)
+        )
+
+    def _evict_for(self, needed_mb):
+        """Descarrega modelos ociosos do LRU até caber `needed_mb`. Chamar com o lock."""
+        used_mb = sum(entry.memory_mb for entry in self._resident.values())
+        for name in list(self._resident):
+            if used_mb + needed_mb <= self.memory_budget_mb:
+                break
+            entry = self._resident[name]
+            if entry.in_use > 0:
+                continue
+            print(f"Descarregando modelo '{name}' para liberar {entry.memory_mb:.0f} MB.")
+            del self._resident[name]
+            entry.llm = None
+            used_mb -= entry.memory_mb
+        if used_mb + needed_mb > self.memory_budget_mb:
+            print(f"AVISO: Orçamento de memória de modelos excedido ({used_mb + needed_mb:.0f} MB de {self.memory_budget_mb} MB).")
+
+    def shrink(self, keep=1):
+        """Descarrega os modelos ociosos menos usados, mantendo no máximo `keep` carregados."""
+        with self._lock:
+            for name in list(self._resident)[:-keep] if keep > 0 else list(self._resident):
+                entry = self._resident[name]
+                if entry.in_use == 0:
+                    del self._resident[name]
+                    entry.llm = None
+
+    def _acquire_entry(self, name):
+        """Retorna o modelo carregado (carregando-o se preciso) já marcado como em uso."""
+        with self._load_locks[name]:
+            with self._lock:
+                entry = self._resident.get(name)
+                if entry is not None:
+                    self._resident.move_to_end(name)
+                    entry.in_use += 1
+                    return entry
+
+            spec = self.specs[name]
+            memory_mb = self.estimate_memory_mb(spec)
+            with self._budget_lock:
+                with self._lock:
+                    self._evict_for(memory_mb)
+                llm = self._load(spec)
+                entry = _ResidentModel(spec, llm, memory_mb)
+                entry.in_use = 1
+                with self._lock:
+                    self._resident[name] = entry
+            return entry
+
+    @contextmanager
+    def acquire(self, name=None):
+        """
+        Obtém o modelo carregado (carregando-o se preciso) durante uma inferência.
+        Se a carga falhar, usa o modelo padrão; o modelo efetivamente usado está em `entry.spec["name"]`.
+        """
+        name = name or self.default_model
+        if name not in self.specs:
+            raise ValueError(f"Modelo '{name}' não está no registro.")
+
+        try:
+            entry = self._acquire_entry(name)
+        except Exception as e:
+            if name == self.default_model:
+                raise
+            print(f"ERRO ao carregar o modelo '{name}': {e}. Usando o modelo padrão '{self.default_model}'.")
+            entry = self._acquire_entry(self.default_model)
+
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+
+    def record(self, name, latency, completion_tokens, generation_time=None):
+        """Registra a latência e os tokens gerados de uma inferência."""
+        with self._lock:
+            stats = self._stats[name]
+            stats["requests"] += 1
+            stats["total_latency"] += latency
+            stats["completion_tokens"] += completion_tokens
+            stats["generation_time"] += generation_time if generation_time is not None else latency
+
+    def get_stats(self):
+        """Retorna latência média e tokens/s de cada modelo que já recebeu requisições."""
+        with self._lock:
+            report = {}
+            for name, stats in self._stats.items():
+                if not stats["requests"]:
+                    continue
+                report[name] = {
+                    "requests": stats["requests"],
+                    "avg_latency": stats["total_latency"] / stats["requests"],
+                    "tokens_per_second": (
+                        stats["completion_tokens"] / stats["generation_time"] if stats["generation_time"] > 0 else 0.0
+                    ),
+                    "resident": name in self._resident
+                }
+            return report
+
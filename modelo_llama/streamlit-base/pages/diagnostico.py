@@ -0,0 +1,86 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+from auth_middleware import check_password_with_cookie
+from functions import (
+    get_resource_report,
+    shrink_memory,
+    archive_idle_sessions
+)
+from resource_monitor import MAX_UPLOAD_MB, SESSION_IDLE_EVICT_SECONDS, SESSION_MIN_IDLE_SECONDS, SESSIONS_MAX_MB
+
+st.set_page_config(
+   page_title="Diagnóstico de Recursos",
+   page_icon="🩺",
+   layout="wide"
+)
+
+if not check_password_with_cookie():
+    st.stop()
+
+st.header("🩺 Diagnóstico de Recursos")
+
+report = get_resource_report()
+
+# --- Resumo ---
+col1, col2, col3, col4 = st.columns(4)
+soft_limit = report["memory_soft_limit_mb"]
+col1.metric("RSS do processo", f"{report['rss_mb']:.0f} MB", help="Memória residente total do processo")
+col2.metric("Limite de RSS", f"{soft_limit} MB" if soft_limit else "desativado")
+col3.metric("Sessões acompanhadas", len(report["sessions"]))
+col4.metric("Limite de upload", f"{MAX_UPLOAD_MB} MB" if MAX_UPLOAD_MB else "desativado")
+
+# --- Memória por componente ---
+st.subheader("Memória por componente")
+components = pd.DataFrame(
+    [{"Componente": name, "MB": round(memory_mb, 1)} for name, memory_mb in report["components"].items()]
+)
+st.bar_chart(components, x="Componente", y="MB", horizontal=True)
+st.caption("Modelos, embeddings, índice e sessões são estimativas; 'Outros' é o restante do RSS medido.")
+
+# --- Memória ao longo do tempo ---
+st.subheader("Memória ao longo do tempo")
+if report["samples"]:
+    samples = pd.DataFrame(report["samples"])
+    samples["time"] = samples["time"].apply(datetime.fromtimestamp)
+    st.line_chart(samples.set_index("time"))
+else:
+    st.caption("Nenhuma amostra coletada ainda. A primeira aparece em alguns segundos.")
+
+# --- Sessões ---
+st.subheader("Sessões")
+st.caption(
+    f"Históricos ociosos há mais de {SESSION_IDLE_EVICT_SECONDS // 60} min são arquivados em disco; "
+    f"limite total de {SESSIONS_MAX_MB} MB para os históricos em memória."
+)
+if report["sessions"]:
+    sessions = pd.DataFrame(report["sessions"]).rename(columns={
+        "session": "Sessão", "username": "Usuário", "size_mb": "Tamanho (MB)",
+        "idle_seconds": "Ociosa (s)", "archived": "Arquivada"
+    })
+    st.dataframe(sessions.round(3), hide_index=True, use_container_width=True)
+
+# --- Ações ---
+st.subheader("Ações")
+col_a1, col_a2 = st.columns(2)
+with col_a1:
+    idle_minutes = st.number_input(
+        "Arquivar sessões ociosas há mais de (min)",
+        min_value=SESSION_MIN_IDLE_SECONDS // 60,
+        value=SESSION_MIN_IDLE_SECONDS // 60
+    )
+    if st.button("Arquivar sessões ociosas", use_container_width=True):
+        freed_mb = archive_idle_sessions(idle_minutes * 60)
+        st.toast(f"{freed_mb:.2f} MB de históricos arquivados em disco.")
+with col_a2:
+    st.write("Descarrega modelos ociosos, limpa caches e arquiva sessões inativas.")
+    if st.button("Reduzir uso de memória", use_container_width=True):
+        shrink_memory()
+        st.rerun()
+
+if report["last_shrink"]:
+    last_shrink = report["last_shrink"]
+    st.caption(
+        f"Última redução em {datetime.fromtimestamp(last_shrink['time']).strftime('%d/%m/%Y %H:%M:%S')}: "
+        f"{last_shrink['rss_before']:.0f} MB → {last_shrink['rss_after']:.0f} MB"
+    )
@@ -0,0 +1,202 @@
+import argparse
+import csv
+import json
+import os
+import time
+
+# Constantes
+DEFAULT_QUESTION_FIELD = "pergunta"
+DEFAULT_ID_FIELD = "id"
+DEFAULT_BATCH_SIZE = 32
+
+
+def read_jsonl_rows(f):
+    """Lê as linhas de um arquivo JSONL, avisando e ignorando as que não são um objeto JSON válido."""
+    for line_number, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"AVISO: Linha {line_number} não é um JSON válido ({e}). Ignorada.")
+            continue
+        if not isinstance(row, dict):
+            print(f"AVISO: Linha {line_number} não é um objeto JSON. Ignorada.")
+            continue
+        yield line_number, row
+
+
+def read_questions(input_path, question_field, id_field):
+    """
+    Lê as perguntas de um arquivo JSONL ou CSV sem carregar o arquivo inteiro na memória.
+    Retorna tuplas (id, pergunta); sem campo de id, usa o número da linha.
+    """
+    with open(input_path, "r", encoding="utf-8", newline="") as f:
+        if input_path.lower().endswith(".csv"):
+            # A linha 1 é o cabeçalho.
+            rows = enumerate(csv.DictReader(f), start=2)
+        else:
+            rows = read_jsonl_rows(f)
+
+        for line_number, row in rows:
+            question = str(row.get(question_field) or "").strip()
+            if not question:
+                print(f"AVISO: Linha {line_number} sem o campo '{question_field}'. Ignorada.")
+                continue
+            question_id = row.get(id_field)
+            # Ids como 0 ou "" são válidos; só a ausência do campo usa o número da linha.
+            yield str(question_id if question_id is not None else line_number), question
+
+
+def load_processed_ids(output_path):
+    """
+    Lê os ids já gravados no arquivo de saída, que também funciona como checkpoint.
+    Respostas com "erro" não contam como processadas e são refeitas na próxima execução; a nova
+    resposta é acrescentada ao arquivo depois do registro com erro.
+    Linhas completas inválidas são ignoradas com um aviso. Só uma última linha sem quebra de linha
+    (execução interrompida no meio da escrita) é descartada do arquivo.
+    """
+    processed = set()
+    if not os.path.exists(output_path):
+        return processed
+
+    valid_size = 0
+    with open(output_path, "rb") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.endswith(b"\n"):
+                break
+            valid_size += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if "erro" not in record:
+                    processed.add(record["id"])
+            except (json.JSONDecodeError, KeyError, TypeError, UnicodeDecodeError) as e:
+                print(f"AVISO: Linha {line_number} do arquivo de saída é inválida ({e}). Ignorada.")
+
+    if valid_size < os.path.getsize(output_path):
+        print("AVISO: Última linha do arquivo de saída incompleta. Ela será reprocessada.")
+        with open(output_path, "r+b") as f:
+            f.truncate(valid_size)
+    return processed
+
+
+def batched(iterable, size):
+    """Agrupa um iterável em listas de até `size` itens."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def process_batch_file(args):
+    """Processa o arquivo de perguntas, gravando cada resposta assim que ela é gerada."""
+    # Importa aqui para que '--help' não precise carregar os modelos.
+    from functions import generate_chat_prompt, invoke_local_model, search_knowledge_base_batch
+
+    if args.reiniciar and os.path.exists(args.saida):
+        os.remove(args.saida)
+    processed_ids = load_processed_ids(args.saida)
+    if processed_ids:
+        print(f"Retomando: {len(processed_ids)} perguntas já respondidas em '{args.saida}'.")
+
+    model_params = {
+        "temperature": args.temperatura,
+        "top_p": 0.8,
+        "top_k": 20,
+        "max_tokens": args.max_tokens
+    }
+
+    answered = 0
+    errors = 0
+    completion_tokens = 0
+    generation_time = 0.0
+    start_time = time.time()
+
+    pending = (
+        (question_id, question)
+        for question_id, question in read_questions(args.entrada, args.campo_pergunta, args.campo_id)
+        if question_id not in processed_ids
+    )
+
+    with open(args.saida, "a", encoding="utf-8") as output:
+        for batch in batched(pending, args.lote):
+            if args.rag:
+                contexts = search_knowledge_base_batch([question for _, question in batch], k=args.k)
+            else:
+                contexts = [""] * len(batch)
+
+            for (question_id, question), context in zip(batch, contexts):
+                messages = generate_chat_prompt(question, context=context)
+                result = invoke_local_model(messages, model_params, model_name=args.modelo)
+
+                record = {
+                    "id": question_id,
+                    "pergunta": question,
+                    "resposta": result.get("answer", ""),
+                    "modelo": result.get("model", ""),
+                    "prompt_tokens": result.get("prompt_tokens", 0),
+                    "completion_tokens": result.get("completion_tokens", 0),
+                    "latencia": round(result.get("latency", 0.0), 3)
+                }
+                if "error" in result:
+                    record["erro"] = result["error"]
+                    errors += 1
+
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+
+                answered += 1
+                completion_tokens += record["completion_tokens"]
+                generation_time += result.get("latency", 0.0)
+
+            os.fsync(output.fileno())
+            report_progress(answered, errors, completion_tokens, generation_time, time.time() - start_time)
+
+    print("\nProcessamento concluído.")
+    report_progress(answered, errors, completion_tokens, generation_time, time.time() - start_time)
+
+
+def report_progress(answered, errors, completion_tokens, generation_time, elapsed):
+    """Mostra o progresso com a vazão em perguntas/hora e tokens/s."""
+    questions_per_hour = answered / elapsed * 3600 if elapsed > 0 else 0.0
+    tokens_per_second = completion_tokens / generation_time if generation_time > 0 else 0.0
+    print(
+        f"{answered} respondidas ({errors} com erro) em {elapsed:.0f}s | "
+        f"{questions_per_hour:.0f} perguntas/hora | {tokens_per_second:.1f} tokens/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Responde em lote perguntas de um arquivo JSONL ou CSV, sem a interface Streamlit."
+    )
+    parser.add_argument("entrada", help="Arquivo de perguntas (.jsonl ou .csv)")
+    parser.add_argument("saida", help="Arquivo de respostas (.jsonl); também usado como checkpoint para retomar")
+    parser.add_argument("--campo-pergunta", default=DEFAULT_QUESTION_FIELD, help="Campo/coluna com a pergunta")
+    parser.add_argument("--campo-id", default=DEFAULT_ID_FIELD, help="Campo/coluna com o id da pergunta")
+    parser.add_argument("--rag", action="store_true", help="Usa a base de conhecimento para buscar contexto")
+    parser.add_argument("--k", type=int, default=4, help="Quantidade de trechos da base por pergunta")
+    parser.add_argument("--lote", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Perguntas por lote de embeddings (e por checkpoint em disco)")
+    parser.add_argument("--modelo", default="auto", help="Nome do modelo do registro ou 'auto'")
+    parser.add_argument("--max-tokens", type=int, default=800, help="Máximo de tokens por resposta")
+    parser.add_argument("--temperatura", type=float, default=0.2, help="Temperatura da geração")
+    parser.add_argument("--reiniciar", action="store_true", help="Descarta o arquivo de saída e começa do zero")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.entrada):
+        parser.error(f"Arquivo de entrada '{args.entrada}' não encontrado.")
+    if args.lote < 1:
+        parser.error("--lote deve ser maior que zero.")
+
+    process_batch_file(args)
+
+
+if __name__ == "__main__":
+    main()
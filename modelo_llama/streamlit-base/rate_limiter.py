@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Constantes (configuráveis por variáveis de ambiente)
+DEFAULT_TOKENS_PER_MINUTE = int(os.environ.get("RATE_LIMIT_TOKENS_PER_MINUTE", "2000"))
+DEFAULT_BURST_TOKENS = int(os.environ.get("RATE_LIMIT_BURST_TOKENS", str(DEFAULT_TOKENS_PER_MINUTE)))
+DEFAULT_MAX_CONCURRENT = int(os.environ.get("RATE_LIMIT_MAX_CONCURRENT", "1"))
+DEFAULT_MAX_CONCURRENT_TOTAL = int(os.environ.get("RATE_LIMIT_MAX_CONCURRENT_TOTAL", "2"))
+
+
+class RateLimitExceeded(Exception):
+    """Erro lançado quando um usuário excede o limite de tokens ou de requisições simultâneas."""
+
+    def __init__(self, message, retry_after=0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Balde de tokens medido em tokens gerados pelo modelo.
+    O nível pode ficar negativo: o custo real de uma resposta só é conhecido no final,
+    e a dívida é paga com a recarga antes da próxima requisição ser aceita.
+    """
+
+    def __init__(self, capacity, tokens_per_minute):
+        self.capacity = capacity
+        self.refill_rate = tokens_per_minute / 60.0
+        self.level = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    def seconds_until_available(self):
+        """Tempo até o nível voltar a ser positivo."""
+        if self.level > 0 or self.refill_rate <= 0:
+            return 0.0
+        return (1 - self.level) / self.refill_rate
+
+    def consume(self, tokens):
+        self.refill()
+        self.level -= tokens
+
+
+class RateLimiter:
+    """
+    Limitador por usuário na frente da inferência: um balde de tokens gerados por minuto
+    e um teto de requisições simultâneas, para que um usuário não monopolize a CPU.
+    Um teto global de requisições simultâneas (somando todos os usuários) protege a CPU
+    mesmo quando várias pessoas compartilham a mesma conta.
+    """
+
+    def __init__(self, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, burst_tokens=DEFAULT_BURST_TOKENS,
+                 max_concurrent=DEFAULT_MAX_CONCURRENT, max_concurrent_total=DEFAULT_MAX_CONCURRENT_TOTAL):
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_tokens = burst_tokens
+        self.max_concurrent = max_concurrent
+        self.max_concurrent_total = max_concurrent_total
+        self._buckets = {}
+        self._active = {}
+        self._active_total = 0
+        self._lock = threading.Lock()
+
+    def _bucket(self, user):
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            bucket = TokenBucket(self.burst_tokens, self.tokens_per_minute)
+            self._buckets[user] = bucket
+        return bucket
+
+    @contextmanager
+    def acquire(self, user):
+        """
+        Reserva uma vaga de inferência para o usuário.
+        Lança RateLimitExceeded se o balde estiver vazio ou o teto de simultaneidade for atingido.
+        Sem usuário (ex.: processamento em lote), não aplica limite.
+        """
+        if user is None:
+            yield
+            return
+
+        with self._lock:
+            bucket = self._bucket(user)
+            bucket.refill()
+            if bucket.level <= 0:
+                retry_after = bucket.seconds_until_available()
+                raise RateLimitExceeded(
+                    f"Limite de {self.tokens_per_minute} tokens por minuto atingido. "
+                    f"Tente novamente em {retry_after:.0f} segundos.",
+                    retry_after
+                )
+            if self._active.get(user, 0) >= self.max_concurrent:
+                raise RateLimitExceeded(
+                    f"Limite de {self.max_concurrent} requisição(ões) simultânea(s) atingido. "
+                    "Aguarde a resposta anterior terminar."
+                )
+            if self.max_concurrent_total and self._active_total >= self.max_concurrent_total:
+                raise RateLimitExceeded(
+                    f"O servidor já está processando {self._active_total} requisição(ões). "
+                    "Tente novamente em alguns segundos."
+                )
+            self._active[user] = self._active.get(user, 0) + 1
+            self._active_total += 1
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active_total -= 1
+                self._active[user] -= 1
+                if not self._active[user]:
+                    del self._active[user]
+
+    def consume(self, user, tokens):
+        """Desconta do balde do usuário os tokens efetivamente gerados."""
+        if user is None or not tokens:
+            return
+        with self._lock:
+            self._bucket(user).consume(tokens)
+
+    def get_status(self, user):
+        """Retorna o saldo atual de tokens e as requisições em andamento do usuário."""
+        with self._lock:
+            bucket = self._bucket(user)
+            bucket.refill()
+            return {
+                "available_tokens": bucket.level,
+                "tokens_per_minute": self.tokens_per_minute,
+                "active_requests": self._active.get(user, 0),
+                "max_concurrent": self.max_concurrent
+            }
@@ -0,0 +1,345 @@
+import json
+import os
+import resource
+import threading
+import time
+from collections import deque
+
+# Constantes (configuráveis por variáveis de ambiente; 0 desativa o limite)
+MEMORY_SOFT_LIMIT_MB = int(os.environ.get("MEMORY_SOFT_LIMIT_MB", "0"))
+SESSIONS_MAX_MB = int(os.environ.get("SESSIONS_MAX_MB", "256"))
+SESSION_IDLE_EVICT_SECONDS = int(os.environ.get("SESSION_IDLE_EVICT_SECONDS", "1800"))
+SESSION_FORGET_SECONDS = int(os.environ.get("SESSION_FORGET_SECONDS", "86400"))
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "10"))
+SAMPLE_INTERVAL_SECONDS = int(os.environ.get("RESOURCE_SAMPLE_INTERVAL_SECONDS", "10"))
+SESSION_ARCHIVE_DIR = "sessoes_arquivadas"
+
+# Sessões com atividade mais recente que isso nunca são arquivadas, mesmo sob pressão de memória
+# (uma inferência longa na CPU mantém a sessão em execução sem novas chamadas a `touch`)
+SESSION_MIN_IDLE_SECONDS = 600
+MESSAGE_OVERHEAD_BYTES = 300
+MB = 1024 * 1024
+
+
+def read_rss_mb():
+    """Memória residente (RSS) atual do processo, em MB."""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Fora do Linux, usa o pico de memória como aproximação (KB no Linux, bytes no macOS).
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / MB if max_rss > 10 * MB else max_rss / 1024
+
+
+def estimate_index_mb(db):
+    """Estimativa da memória do índice FAISS (vetores) mais o docstore (textos dos chunks)."""
+    if db is None:
+        return 0.0
+    index = db.index
+    vectors_bytes = index.ntotal * index.d * 4
+    docstore = getattr(db.docstore, "_dict", {})
+    docs_bytes = sum(
+        len(doc.page_content.encode("utf-8")) + len(str(doc.metadata)) + MESSAGE_OVERHEAD_BYTES
+        for doc in docstore.values()
+    )
+    return (vectors_bytes + docs_bytes) / MB
+
+
+def estimate_torch_module_mb(module):
+    """Memória dos parâmetros de um módulo PyTorch (ex.: o SentenceTransformer dos embeddings)."""
+    if module is None or not hasattr(module, "parameters"):
+        return 0.0
+    return sum(p.numel() * p.element_size() for p in module.parameters()) / MB
+
+
+def estimate_messages_bytes(messages):
+    return sum(len(message.get("content", "")) + MESSAGE_OVERHEAD_BYTES for message in messages)
+
+
+def check_upload_size(uploaded_file, max_upload_mb=MAX_UPLOAD_MB):
+    """Retorna uma mensagem de erro se o arquivo enviado exceder o limite, ou None."""
+    if max_upload_mb and uploaded_file.size > max_upload_mb * MB:
+        return f"arquivo de {uploaded_file.size / MB:.1f} MB excede o limite de {max_upload_mb} MB"
+    return None
+
+
+class _SessionEntry:
+    """Referências ao histórico de uma sessão do Streamlit e seu uso de memória."""
+
+    def __init__(self, session_key, username):
+        self.session_key = session_key
+        self.username = username
+        self.chat_history = None
+        self.messages = None
+        self.size_bytes = 0
+        self.last_active = time.time()
+        self.archived_path = None
+
+
+class SessionTracker:
+    """
+    Acompanha o tamanho do histórico de chat de cada sessão conectada.
+
+    Guarda referências às mesmas listas do `st.session_state` de cada sessão, o que permite
+    arquivar em disco o histórico de sessões ociosas (esvaziando as listas) e restaurá-lo
+    quando a sessão voltar a ser usada.
+    """
+
+    def __init__(self, archive_dir=SESSION_ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _measure(chat_history, messages):
+        seen = set()
+        total = 0
+        for message_list in [messages] + [chat["messages"] for chat in chat_history]:
+            if id(message_list) in seen:
+                continue
+            seen.add(id(message_list))
+            total += estimate_messages_bytes(message_list)
+        return total
+
+    def touch(self, session_key, chat_history, messages, username=None):
+        """
+        Registra atividade da sessão no início de cada execução do script.
+        Se o histórico tiver sido arquivado, ele é restaurado nas mesmas listas. Retorna True nesse caso.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_key)
+            if entry is None:
+                entry = _SessionEntry(session_key, username)
+                self._sessions[session_key] = entry
+
+            restored = False
+            if entry.archived_path is not None:
+                self._restore(entry, chat_history, messages)
+                restored = True
+
+            entry.username = username or entry.username
+            entry.chat_history = chat_history
+            entry.messages = messages
+            entry.size_bytes = self._measure(chat_history, messages)
+            entry.last_active = time.time()
+            return restored
+
+    def _restore(self, entry, chat_history, messages):
+        """
+        Recoloca o histórico arquivado nas listas da sessão. Chamar com o lock.
+        O conteúdo atual das listas é mantido depois do arquivado: se a sessão foi arquivada durante
+        uma execução (ex.: inferência longa), a resposta gravada depois do arquivamento não se perde.
+        """
+        try:
+            with open(entry.archived_path, "r", encoding="utf-8") as f:
+                archived = json.load(f)
+            messages[:] = archived["messages"] + messages
+            for chat, archived_messages in zip(chat_history, archived["chats"]):
+                # A conversa aberta volta a compartilhar a mesma lista de `messages`, como antes do arquivamento.
+                if chat["messages"] is messages or (archived_messages and archived_messages == archived["messages"]):
+                    chat["messages"] = messages
+                else:
+                    chat["messages"] = archived_messages + chat["messages"]
+            os.remove(entry.archived_path)
+            print(f"Histórico da sessão '{entry.session_key}' restaurado do disco.")
+        except (OSError, json.JSONDecodeError, KeyError) as e:
+            print(f"ERRO ao restaurar o histórico da sessão '{entry.session_key}': {e}")
+        entry.archived_path = None
+
+    def _archive(self, entry):
+        """Grava o histórico da sessão em disco e esvazia as listas em memória. Chamar com o lock."""
+        if entry.archived_path is not None or entry.chat_history is None or not entry.size_bytes:
+            return 0
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archive_path = os.path.join(self.archive_dir, f"{entry.session_key}.json")
+        with open(archive_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "chats": [chat["messages"] for chat in entry.chat_history],
+                "messages": list(entry.messages)
+            }, f, ensure_ascii=False)
+
+        for chat in entry.chat_history:
+            chat["messages"] = []
+        entry.messages.clear()
+
+        freed = entry.size_bytes
+        entry.archived_path = archive_path
+        entry.size_bytes = 0
+        print(f"Histórico da sessão '{entry.session_key}' arquivado em disco ({freed / MB:.2f} MB).")
+        return freed
+
+    def evict_idle(self, idle_seconds=SESSION_IDLE_EVICT_SECONDS):
+        """
+        Arquiva o histórico das sessões sem atividade há mais de `idle_seconds`. Retorna os MB liberados.
+        O tempo nunca é menor que SESSION_MIN_IDLE_SECONDS, para não arquivar uma sessão em execução.
+        """
+        if not idle_seconds:
+            return 0.0
+        idle_seconds = max(idle_seconds, SESSION_MIN_IDLE_SECONDS)
+        freed = 0
+        now = time.time()
+        with self._lock:
+            for entry in list(self._sessions.values()):
+                if now - entry.last_active > idle_seconds:
+                    freed += self._archive(entry)
+        return freed / MB
+
+    def enforce_total_limit(self, max_mb=SESSIONS_MAX_MB):
+        """Arquiva as sessões menos recentes até o total de históricos ficar abaixo de `max_mb`."""
+        if not max_mb:
+            return 0.0
+        freed = 0
+        now = time.time()
+        with self._lock:
+            total = sum(entry.size_bytes for entry in self._sessions.values())
+            for entry in sorted(self._sessions.values(), key=lambda e: e.last_active):
+                if total <= max_mb * MB:
+                    break
+                if now - entry.last_active < SESSION_MIN_IDLE_SECONDS:
+                    continue
+                released = self._archive(entry)
+                total -= released
+                freed += released
+        return freed / MB
+
+    def forget_stale(self, forget_seconds=SESSION_FORGET_SECONDS):
+        """
+        Descarta as sessões abandonadas há mais de `forget_seconds`, junto com o histórico arquivado.
+        Uma aba que volte depois disso recomeça com o histórico vazio. Arquivos antigos de sessões
+        que não estão mais sendo acompanhadas também são removidos.
+        """
+        now = time.time()
+        with self._lock:
+            for session_key, entry in list(self._sessions.items()):
+                if now - entry.last_active > forget_seconds:
+                    if entry.archived_path and os.path.exists(entry.archived_path):
+                        os.remove(entry.archived_path)
+                    del self._sessions[session_key]
+
+            # Arquivos de sessões que não estão mais sendo acompanhadas (ex.: de antes de um reinício).
+            tracked = {entry.archived_path for entry in self._sessions.values() if entry.archived_path}
+            if os.path.isdir(self.archive_dir):
+                for name in os.listdir(self.archive_dir):
+                    path = os.path.join(self.archive_dir, name)
+                    try:
+                        if path not in tracked and now - os.path.getmtime(path) > forget_seconds:
+                            os.remove(path)
+                    except OSError:
+                        pass
+
+    def total_mb(self):
+        with self._lock:
+            return sum(entry.size_bytes for entry in self._sessions.values()) / MB
+
+    def get_sessions(self):
+        """Lista as sessões acompanhadas com tamanho, usuário, tempo ocioso e se estão arquivadas."""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "session": entry.session_key[:8],
+                    "username": entry.username or "-",
+                    "size_mb": entry.size_bytes / MB,
+                    "idle_seconds": now - entry.last_active,
+                    "archived": entry.archived_path is not None
+                }
+                for entry in sorted(self._sessions.values(), key=lambda e: e.size_bytes, reverse=True)
+            ]
+
+
+class ResourceMonitor:
+    """
+    Contabilidade de memória do processo.
+
+    Amostra periodicamente o RSS e a estimativa de cada componente registrado (modelos,
+    embeddings, índice, sessões), guarda o histórico para o gráfico de memória e aplica os
+    limites: arquiva sessões ociosas e, acima do limite de RSS, executa as ações de redução.
+    """
+
+    def __init__(self, session_tracker, sample_interval=SAMPLE_INTERVAL_SECONDS, history_size=720):
+        self.session_tracker = session_tracker
+        self.sample_interval = sample_interval
+        self.memory_soft_limit_mb = MEMORY_SOFT_LIMIT_MB
+        self.samples = deque(maxlen=history_size)
+        self.last_shrink = None
+        self._components = {}
+        self._shrink_actions = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def register_component(self, name, estimate_mb):
+        """Registra uma função que retorna a memória estimada (MB) de um componente."""
+        with self._lock:
+            self._components[name] = estimate_mb
+
+    def register_shrink_action(self, name, action):
+        """Registra uma ação de redução de memória (ex.: descarregar modelos, limpar caches)."""
+        with self._lock:
+            self._shrink_actions[name] = action
+
+    def breakdown(self):
+        """Retorna o RSS atual e a estimativa de cada componente; a diferença vai para 'Outros'."""
+        with self._lock:
+            components = dict(self._components)
+
+        rss_mb = read_rss_mb()
+        report = {}
+        for name, estimate_mb in components.items():
+            try:
+                report[name] = float(estimate_mb())
+            except Exception as e:
+                print(f"ERRO ao estimar a memória de '{name}': {e}")
+                report[name] = 0.0
+        report["Outros"] = max(0.0, rss_mb - sum(report.values()))
+        return rss_mb, report
+
+    def shrink(self):
+        """Executa todas as ações de redução de memória registradas."""
+        with self._lock:
+            actions = dict(self._shrink_actions)
+
+        rss_before = read_rss_mb()
+        for name, action in actions.items():
+            try:
+                action()
+            except Exception as e:
+                print(f"ERRO na ação de redução de memória '{name}': {e}")
+        self.last_shrink = {"time": time.time(), "rss_before": rss_before, "rss_after": read_rss_mb()}
+        print(f"Redução de memória executada: {rss_before:.0f} MB -> {self.last_shrink['rss_after']:.0f} MB.")
+
+    def sample(self):
+        """Coleta uma amostra e aplica os limites configurados."""
+        self.session_tracker.evict_idle()
+        self.session_tracker.enforce_total_limit()
+        self.session_tracker.forget_stale()
+
+        rss_mb, report = self.breakdown()
+        self.samples.append({"time": time.time(), "rss_mb": rss_mb, **report})
+
+        if self.memory_soft_limit_mb and rss_mb > self.memory_soft_limit_mb:
+            print(f"AVISO: RSS de {rss_mb:.0f} MB acima do limite de {self.memory_soft_limit_mb} MB.")
+            self.shrink()
+
+    def start(self):
+        """Inicia a thread de amostragem em segundo plano."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop_event.wait(self.sample_interval):
+                try:
+                    self.sample()
+                except Exception as e:
+                    print(f"ERRO no monitoramento de recursos: {e}")
+
+        self._thread = threading.Thread(target=run, name="resource-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,151 @@
+import json
+from functools import lru_cache
+
+import jsonschema
+from llama_cpp import LlamaGrammar
+
+# Esquema padrão para respostas de diagnóstico
+DIAGNOSTIC_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "resumo": {"type": "string"},
+        "causa_provavel": {"type": "string"},
+        "passos": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "descricao": {"type": "string"},
+                    "comando": {"type": "string"}
+                },
+                "required": ["descricao", "comando"]
+            }
+        }
+    },
+    "required": ["resumo", "causa_provavel", "passos"]
+}
+
+
+def schema_to_key(schema):
+    """Serializa o esquema de forma canônica para ser usado como chave de cache."""
+    return json.dumps(schema, sort_keys=True, ensure_ascii=False)
+
+
+@lru_cache(maxsize=32)
+def _compile_grammar_cached(schema_key):
+    return LlamaGrammar.from_json_schema(schema_key, verbose=False)
+
+
+def compile_grammar(schema):
+    """
+    Converte um JSON schema em uma gramática GBNF do llama.cpp.
+    A compilação é memorizada por esquema, já que o mesmo esquema é usado em todas as chamadas.
+    """
+    return _compile_grammar_cached(schema_to_key(schema))
+
+
+def clear_grammar_cache():
+    """Descarta as gramáticas compiladas (usado pela redução de memória)."""
+    _compile_grammar_cached.cache_clear()
+
+
+def schema_instruction(schema):
+    """Instrução adicionada à pergunta para orientar o modelo sobre o formato esperado."""
+    return (
+        "\n\n**Responda somente com um objeto JSON válido que siga este esquema "
+        f"(textos em Português do Brasil):**\n{schema_to_key(schema)}"
+    )
+
+
+class PartialJsonValidator:
+    """
+    Acompanha o texto JSON gerado em streaming, caractere a caractere.
+
+    Detecta quando o objeto de nível superior foi fechado (para encerrar a geração cedo),
+    identifica erros estruturais assim que aparecem e permite obter uma versão
+    parcial do objeto a qualquer momento.
+    """
+
+    _CLOSERS = {"{": "}", "[": "]"}
+
+    def __init__(self):
+        self.text = ""
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.complete = False
+        self.error = None
+        self._last_partial = None
+
+    def feed(self, chunk):
+        """Processa um novo trecho. Retorna True quando o objeto de nível superior foi fechado."""
+        for char in chunk:
+            if self.complete or self.error:
+                break
+            self.text += char
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if not self.started:
+                if char.isspace():
+                    continue
+                if char != "{":
+                    self.error = f"JSON deve começar com '{{', recebido {char!r}"
+                    break
+                self.started = True
+
+            if char == '"':
+                self.in_string = True
+            elif char in self._CLOSERS:
+                self.stack.append(self._CLOSERS[char])
+            elif char in ("}", "]"):
+                if not self.stack or self.stack.pop() != char:
+                    self.error = f"Fechamento inesperado {char!r} na posição {len(self.text) - 1}"
+                    break
+                if not self.stack:
+                    self.complete = True
+        return self.complete
+
+    def partial_object(self):
+        """
+        Retorna o melhor objeto possível a partir do texto recebido até agora,
+        fechando strings e colchetes pendentes. Números e literais (true/false/null) incompletos
+        não são completados: enquanto um deles estiver pela metade, retorna o último objeto parcial
+        válido, que pode estar defasado (ou None se ainda não houve nenhum, ex.: `{"a": tru`).
+        """
+        if not self.started or self.error:
+            return None
+        if self.complete:
+            return json.loads(self.text)
+
+        candidate = self.text
+        if self.in_string:
+            if self.escape:
+                candidate = candidate[:-1]
+            candidate += '"'
+        candidate = candidate.rstrip().rstrip(",")
+        if candidate.endswith(":"):
+            candidate += " null"
+        candidate += "".join(reversed(self.stack))
+        try:
+            self._last_partial = json.loads(candidate)
+        except json.JSONDecodeError:
+            pass
+        return self._last_partial
+
+
+def validate_against_schema(data, schema):
+    """Valida o objeto com o esquema. Retorna None se for válido ou a mensagem de erro."""
+    try:
+        jsonschema.validate(instance=data, schema=schema)
+        return None
+    except jsonschema.ValidationError as e:
+        return e.message
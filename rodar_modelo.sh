@@ -18,4 +18,5 @@ echo "Criando base de Conhecimento.."
 python3 criar_base_conhecimento.py
 
 echo "Executando a aplicação:"
-streamlit run app.py
+# O limite de upload é aplicado pelo Streamlit, com o mesmo valor verificado pela aplicação.
+streamlit run app.py --server.maxUploadSize "${MAX_UPLOAD_MB:-10}"